@@ -0,0 +1,158 @@
+import argparse
+import json
+import platform
+import random
+import time
+import tracemalloc
+
+import rdf_star
+from rdf_star import RDF_Star_Graph
+
+# Translation algorithms to benchmark
+# key: RDF_Star_Graph method, value: whether it takes a star_format argument
+algorithms = {
+    "simplify": False,
+    "decompose": True,
+    "convertToRegularRDF": True,
+    "shortcutConvert": False,
+    "shortcutConvertV2": False,
+    "enhancedConvertV1": True,
+    "enhancedConvertV2": True,
+}
+
+# Generate a synthetic RDF* graph
+# Each base fact (s, p, o) is added as a plain triple, then qualified by
+# fan_out statements that quote it. One of those is quoted again by fan_out
+# statements, and so on until the given nesting depth is reached. Quoted
+# triples go in the subject with probability subject_ratio, else the object
+def generate_graph(num_statements, depth=1, subject_ratio=0.5, fan_out=3, num_entities=1000, num_relations=50, seed=0):
+    rng = random.Random(seed)
+    entities = ["<http://example.org/entity/" + str(i) + ">" for i in range(num_entities)]
+    relations = ["<http://example.org/relation/" + str(i) + ">" for i in range(num_relations)]
+    graph = RDF_Star_Graph()
+
+    while len(graph) < num_statements:
+        quoted = (rng.choice(entities), rng.choice(relations), rng.choice(entities))
+        graph.add(quoted)
+
+        for _ in range(depth):
+            statements = []
+            for _ in range(fan_out):
+                if rng.random() < subject_ratio:
+                    statements.append((quoted, rng.choice(relations), rng.choice(entities)))
+                else:
+                    statements.append((rng.choice(entities), rng.choice(relations), quoted))
+            for statement in statements:
+                if len(graph) < num_statements:
+                    graph.add(statement)
+            quoted = rng.choice(statements)
+
+    return graph
+
+# Run one translation algorithm on a graph, starting from an empty bn_dict
+# and translation cache
+def _translate(graph, algorithm, star_format):
+    rdf_star.bn_dict.clear()
+    if rdf_star.translation_cache is not None:
+        rdf_star.translation_cache.clear()
+    if algorithms[algorithm]:
+        return getattr(graph, algorithm)(star_format=star_format)
+    return getattr(graph, algorithm)()
+
+# Benchmark translation algorithms on a graph
+# Times are the best of repeat runs. With trace_memory set, each algorithm
+# is run once more under tracemalloc to get its peak memory and the
+# rdf_star counters, since tracing slows the run down too much to time it
+# at the same time
+def run_benchmark(graph, algorithm_names=None, star_format="n-triples", repeat=1, trace_memory=True):
+    results = []
+
+    for algorithm in algorithm_names or list(algorithms):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            output = _translate(graph, algorithm, star_format)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        output_size = len(output)
+        del output
+
+        result = {
+            "algorithm": algorithm,
+            "statements": len(graph),
+            "seconds": best,
+            "statements_per_second": len(graph) / best if best > 0 else None,
+            "output_triples": output_size,
+        }
+
+        if trace_memory:
+            tracemalloc.start()
+            with rdf_star.Metrics() as metrics:
+                output = _translate(graph, algorithm, star_format)
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result["counters"] = metrics.counters
+            del output
+
+        results.append(result)
+
+    rdf_star.bn_dict.clear()
+    return results
+
+# Write benchmark results, with the parameters and environment they come
+# from, to a JSON file
+def write_results(file_name, results, params):
+    report = {
+        "params": params,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+    with open(file_name, 'w', encoding='utf-8') as out_file:
+        json.dump(report, out_file, indent=2)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the RDF* translation algorithms on synthetic graphs")
+    parser.add_argument("--statements", type=int, default=10000, help="number of RDF* statements")
+    parser.add_argument("--depth", type=int, default=1, help="nesting depth of quoted triples")
+    parser.add_argument("--subject-ratio", type=float, default=0.5, help="share of quoted triples in subject position")
+    parser.add_argument("--fan-out", type=int, default=3, help="qualifier statements per quoted triple")
+    parser.add_argument("--entities", type=int, default=1000, help="entity vocabulary size")
+    parser.add_argument("--relations", type=int, default=50, help="relation vocabulary size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--algorithms", nargs="+", choices=list(algorithms), help="algorithms to run (default: all)")
+    parser.add_argument("--star-format", default="n-triples", choices=["n-triples", "csv"])
+    parser.add_argument("--repeat", type=int, default=1, help="runs per algorithm, the best time is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc peak memory runs")
+    parser.add_argument("--output", help="JSON file to write the results to")
+    args = parser.parse_args()
+
+    params = {
+        "statements": args.statements,
+        "depth": args.depth,
+        "subject_ratio": args.subject_ratio,
+        "fan_out": args.fan_out,
+        "entities": args.entities,
+        "relations": args.relations,
+        "seed": args.seed,
+        "star_format": args.star_format,
+        "repeat": args.repeat,
+    }
+
+    graph = generate_graph(args.statements, args.depth, args.subject_ratio, args.fan_out,
+                           args.entities, args.relations, args.seed)
+    results = run_benchmark(graph, args.algorithms, args.star_format, args.repeat, not args.no_memory)
+
+    for result in results:
+        line = "{:<22} {:>9.3f} s {:>12.0f} stmt/s {:>10} triples".format(
+            result["algorithm"], result["seconds"], result["statements_per_second"] or 0, result["output_triples"])
+        if "peak_memory_bytes" in result:
+            line += " {:>9.1f} MiB".format(result["peak_memory_bytes"] / 2**20)
+        print(line)
+
+    if args.output:
+        write_results(args.output, results, params)
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,80 @@
+import hashlib
+import os
 import random
+import tempfile
+from bisect import bisect_right
 
-def shuffle_data(in_filename, out_filename):
-    lines = open(in_filename, encoding='utf-8').readlines()
-    random.shuffle(lines)
-    open(out_filename, 'w', encoding='utf-8').writelines(lines)
+# Size of the blocks read and written at a time
+block_size = 1 << 24
+
+# Read a file in large blocks of complete lines, as bytes
+# Newlines are normalised to \n like text mode reading does. The last block
+# may end in a line without a newline
+def _read_blocks(in_filename):
+    with open(in_filename, "rb") as in_file:
+        carry = b""
+        while True:
+            data = in_file.read(block_size)
+            if not data:
+                break
+            data = carry + data
+            # Hold back a trailing \r in case the next block starts with \n
+            if data.endswith(b"\r"):
+                data, carry = data[:-1], b"\r"
+            else:
+                carry = b""
+            data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            end = data.rfind(b"\n") + 1
+            if end:
+                yield data[:end]
+            carry = data[end:] + carry
+        if carry:
+            yield carry.replace(b"\r", b"\n")
+
+# Shuffle the lines of a file
+# Files up to memory_limit bytes are shuffled in memory. Larger files are
+# shuffled out of core: lines are scattered at random over temporary bucket
+# files of about memory_limit bytes each, then each bucket is shuffled in
+# memory and appended to the output
+def shuffle_data(in_filename, out_filename, seed=None, memory_limit=1 << 30, temp_dir=None):
+    rng = random.Random(seed) if seed is not None else random
+    num_buckets = -(-os.path.getsize(in_filename) // memory_limit)
+
+    if num_buckets <= 1:
+        lines = b"".join(_read_blocks(in_filename)).splitlines(True)
+        _shuffle_lines(lines, rng)
+        with open(out_filename, "wb") as out_file:
+            out_file.writelines(lines)
+        return
+
+    with tempfile.TemporaryDirectory(dir=temp_dir) as bucket_dir:
+        bucket_names = [os.path.join(bucket_dir, str(i)) for i in range(num_buckets)]
+        buckets = [open(name, "wb") for name in bucket_names]
+        try:
+            for block in _read_blocks(in_filename):
+                scattered = [[] for _ in range(num_buckets)]
+                for line in block.splitlines(True):
+                    scattered[rng.randrange(num_buckets)].append(line)
+                for bucket, lines in zip(buckets, scattered):
+                    bucket.write(b"".join(lines))
+        finally:
+            for bucket in buckets:
+                bucket.close()
+
+        with open(out_filename, "wb") as out_file:
+            for name in bucket_names:
+                with open(name, "rb") as bucket:
+                    lines = bucket.read().splitlines(True)
+                os.remove(name)
+                _shuffle_lines(lines, rng)
+                out_file.writelines(lines)
+
+# Shuffle lines in place, making sure every line ends in a newline so that
+# the last line of the input does not run into the next one
+def _shuffle_lines(lines, rng):
+    if lines and not lines[-1].endswith(b"\n"):
+        lines[-1] += b"\n"
+    rng.shuffle(lines)
 
 def take_subset(in_filename, out_filename, start, end):
     in_file  = open(in_filename , "r", encoding='utf-8')
@@ -16,54 +87,95 @@ def take_subset(in_filename, out_filename, start, end):
     in_file.close()
     out_file.close()
 
-def train_valid_test_split(in_filename, train_filename, valid_filename, test_filename, train_p=0.8, valid_p=0.1):
+# Split a file into train, validation and test files, reading it once
+# By default the first train_p of the lines go to the train file, the next
+# valid_p to the validation file and the rest to the test file. With
+# by_hash set, each line goes to the split its hash falls in instead, so
+# that a line always lands in the same split whatever the order or size of
+# the input. Split sizes are then only approximately train_p and valid_p
+def train_valid_test_split(in_filename, train_filename, valid_filename, test_filename, train_p=0.8, valid_p=0.1,
+                           by_hash=False):
+    _split(in_filename, [train_filename, valid_filename, test_filename], [train_p, valid_p], by_hash)
 
-    file_length = sum(1 for _ in open(in_filename, "r", encoding='utf-8'))
-    print("File length:", file_length)
-    train_size = int(file_length * train_p)
-    valid_size = int(file_length * valid_p)
-    test_size = file_length - train_size - valid_size
+def train_test_split(in_filename, train_filename, test_filename, train_p=0.8, by_hash=False):
+    _split(in_filename, [train_filename, test_filename], [train_p], by_hash)
 
-    in_file    = open(in_filename,    "r", encoding='utf-8')
-    train_file = open(train_filename, "w", encoding='utf-8')
-    valid_file = open(valid_filename, "w", encoding='utf-8')
-    test_file  = open(test_filename,  "w", encoding='utf-8')
+def _split(in_filename, out_filenames, fractions, by_hash):
+    if by_hash:
+        _split_by_hash(in_filename, out_filenames, fractions)
+    else:
+        _split_by_position(in_filename, out_filenames, fractions)
 
-    for _ in range(train_size):
-        line = in_file.readline()
-        train_file.write(line)
+# All lines are written to the first file while the input is read and
+# checkpoints of the line count and offset at each block are kept. Once the
+# line count is known, the lines past the first split are moved from the end
+# of the first file to the other files and the first file is truncated
+def _split_by_position(in_filename, out_filenames, fractions):
+    checkpoints_lines = []
+    checkpoints_offsets = []
+    file_length = 0
+    offset = 0
 
-    for _ in range(valid_size):
-        line = in_file.readline()
-        valid_file.write(line)
+    with open(out_filenames[0], "w+b") as first_file:
+        for block in _read_blocks(in_filename):
+            checkpoints_lines.append(file_length)
+            checkpoints_offsets.append(offset)
+            file_length += block.count(b"\n")
+            if not block.endswith(b"\n"):
+                file_length += 1
+            first_file.write(block)
+            offset += len(block)
+        print("File length:", file_length)
 
-    for _ in range(test_size):
-        line = in_file.readline()
-        test_file.write(line)
-
-    in_file.close()
-    train_file.close()
-    valid_file.close()
-    test_file.close()
-    
-def train_test_split(in_filename, train_filename, test_filename, train_p=0.8):
-    file_length = sum(1 for _ in open(in_filename, "r", encoding='utf-8'))
-    print("File length:", file_length)
-    train_size = int(file_length * train_p)
-    test_size = file_length - train_size
+        # Line numbers at which each split after the first starts
+        bounds = []
+        total = 0
+        for p in fractions:
+            total += int(file_length * p)
+            bounds.append(total)
 
-    in_file    = open(in_filename,    "r", encoding='utf-8')
-    train_file = open(train_filename, "w", encoding='utf-8')
-    test_file  = open(test_filename,  "w", encoding='utf-8')
+        def line_offset(line):
+            if line >= file_length:
+                return offset
+            i = bisect_right(checkpoints_lines, line) - 1
+            end = checkpoints_offsets[i + 1] if i + 1 < len(checkpoints_offsets) else offset
+            first_file.seek(checkpoints_offsets[i])
+            block = first_file.read(end - checkpoints_offsets[i])
+            position = 0
+            for _ in range(line - checkpoints_lines[i]):
+                position = block.index(b"\n", position) + 1
+            return checkpoints_offsets[i] + position
 
-    for _ in range(train_size):
-        line = in_file.readline()
-        train_file.write(line)
+        offsets = [line_offset(line) for line in bounds] + [offset]
+        for out_filename, start, end in zip(out_filenames[1:], offsets, offsets[1:]):
+            with open(out_filename, "wb") as out_file:
+                first_file.seek(start)
+                while start < end:
+                    data = first_file.read(min(block_size, end - start))
+                    out_file.write(data)
+                    start += len(data)
+        first_file.truncate(offsets[0])
 
-    for _ in range(test_size):
-        line = in_file.readline()
-        test_file.write(line)
+# Each line goes to the split its 64 bit hash, as a fraction of 2^64, falls in
+def _split_by_hash(in_filename, out_filenames, fractions):
+    limits = []
+    total = 0
+    for p in fractions:
+        total += p
+        limits.append(int(total * 2**64))
+    file_length = 0
 
-    in_file.close()
-    train_file.close()
-    test_file.close()
\ No newline at end of file
+    out_files = [open(out_filename, "wb") for out_filename in out_filenames]
+    try:
+        for block in _read_blocks(in_filename):
+            splits = [[] for _ in out_files]
+            for line in block.splitlines(True):
+                digest = hashlib.blake2b(line.rstrip(b"\n"), digest_size=8).digest()
+                splits[bisect_right(limits, int.from_bytes(digest, "big"))].append(line)
+                file_length += 1
+            for out_file, lines in zip(out_files, splits):
+                out_file.write(b"".join(lines))
+    finally:
+        for out_file in out_files:
+            out_file.close()
+    print("File length:", file_length)
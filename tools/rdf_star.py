@@ -1,94 +1,474 @@
+import bz2
 import csv
+import gzip
+import hashlib
+import heapq
+import lzma
+import mmap
+import multiprocessing
+import os
+import pickle
 import random
+import re
+import struct
+import sys
+import tempfile
+import time
+import weakref
+from array import array
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager, nullcontext
+from functools import partial
+from itertools import accumulate, chain, count, islice
+from operator import attrgetter, itemgetter
+from urllib.parse import urljoin
 
 # Dictionary to store all quoted triples and their corresponding blank nodes
-# key: RDF* triple as string, value: Blank node
+# key: quoted RDF* triple, value: Blank node
 bn_dict = dict()
+# Content names of quoted triples, see blank_node_name
+# key: quoted RDF* triple, value: name of its blank node
+# None while blank nodes are minted with counter labels instead, as in a
+# single process run. Passes that must agree on names with other passes
+# or processes swap in a dictionary
+bn_names = None
 s_URI = "<https://w3c.github.io/rdf-star/unstar#subject>"
 p_URI = "<https://w3c.github.io/rdf-star/unstar#predicate>"
 o_URI = "<https://w3c.github.io/rdf-star/unstar#object>"
 s_flag = "unstar.subject"
 p_flag = "unstar.predicate"
 o_flag = "unstar.object"
+reification_preds = {s_URI, p_URI, o_URI, s_flag, p_flag, o_flag}
 
+# Metrics object that collects counters and timings, or None when nothing
+# is attached. Code paths only check this global, so instrumentation costs
+# next to nothing when it is switched off
+metrics = None
+
+# Collects counters (statements processed, blank nodes minted, bn_dict hits
+# and misses, triples emitted per algorithm, ...) and phase timings
+# progress is called as progress(counter_name, count) every progress_every
+# items of a tracked stream and at its end, and log is called with the
+# messages that are otherwise printed. Attach with set_metrics, or use it
+# as a context manager
+class Metrics():
+    
+    def __init__(self, progress=None, progress_every=100000, log=None):
+        self.counters = dict()  # key: counter name, value: count
+        self.timings = dict()   # key: phase name, value: total seconds
+        self.progress = progress
+        self.progress_every = progress_every
+        self.log = log
+        self.previous = None
+        
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+        
+    # Time a phase of work, adding to the total for the phase name
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+    
+    # Pass through a stream of items, counting them and reporting progress
+    def track(self, items, name):
+        count = 0
+        reported = 0
+        for item in items:
+            yield item
+            count += 1
+            if count - reported == self.progress_every:
+                self.count(name, count - reported)
+                reported = count
+                if self.progress is not None:
+                    self.progress(name, count)
+        self.count(name, count - reported)
+        if self.progress is not None:
+            self.progress(name, count)
+            
+    def __enter__(self):
+        self.previous = set_metrics(self)
+        return self
+    
+    def __exit__(self, *exc_info):
+        set_metrics(self.previous)
+        
+# Attach a Metrics object (or None to detach). Returns the previous one
+# Metrics are per process, so worker processes of translate_parallel only
+# report what the parent process sees
+def set_metrics(new_metrics):
+    global metrics
+    previous = metrics
+    metrics = new_metrics
+    return previous
+
+def _count(name, amount=1):
+    if metrics is not None:
+        metrics.count(name, amount)
+        
+def _phase(name):
+    if metrics is None:
+        return nullcontext()
+    return metrics.phase(name)
+
+def _track(items, name):
+    if metrics is None:
+        return items
+    return metrics.track(items, name)
+
+# Messages go to the log function of the attached metrics, or are printed
+def _log(*message):
+    if metrics is not None and metrics.log is not None:
+        metrics.log(" ".join(map(str, message)))
+    else:
+        print(*message)
+
+# Traversal engine for nested RDF* statements. Structural operations on
+# triples and quoted triple IDs run on these three functions, which keep
+# explicit stacks instead of recursing, so statements can be nested to any
+# depth. RDF triples and triples quoting only RDF triples (level 0 and 1)
+# are mostly handled directly by the callers, as that is quicker for them
+# Statements nested up to _max_recursion_level levels deep are converted to
+# tuples and strings, decomposed and searched for quoted triples by plain
+# recursion instead, which is quicker at the depths found in practice. The
+# engine takes over beyond it
+_max_recursion_level = 50
+
+# List the given nodes and all their descendants in depth-first pre-order
+# children gives the nodes below a node, or an empty tuple for a leaf. It
+# may return an iterator, which is only advanced once the previous child
+# and everything below it have been listed
+def _visit(nodes, children):
+    visited = []
+    stack = [iter(nodes)]
+    while stack:
+        for node in stack[-1]:
+            visited.append(node)
+            kids = children(node)
+            if kids:
+                stack.append(iter(kids))
+                break
+        else:
+            stack.pop()
+    return visited
+
+# List only the leaves that _visit would list, in the same order
+def _leaves(nodes, children):
+    leaves = []
+    stack = [iter(nodes)]
+    while stack:
+        for node in stack[-1]:
+            kids = children(node)
+            if kids:
+                stack.append(iter(kids))
+                break
+            leaves.append(node)
+        else:
+            stack.pop()
+    return leaves
+
+# Compute a value for a nested node bottom-up. parts gives the parts of a
+# node, and the parts that are of node_type are nodes themselves. Every
+# node gets combine(node, *values of its parts), where the value of any
+# other part is leaf(part), or the part itself if there is no leaf function
+def _fold(root, parts, combine, node_type, leaf=None):
+    # Each frame holds a node, its remaining parts and the values of the
+    # parts done so far
+    stack = [(root, iter(parts(root)), [])]
+    while True:
+        node, remaining, values = stack[-1]
+        for part in remaining:
+            if isinstance(part, node_type):
+                stack.append((part, iter(parts(part)), []))
+                break
+            values.append(part if leaf is None else leaf(part))
+        else:
+            stack.pop()
+            value = combine(node, *values)
+            if not stack:
+                return value
+            stack[-1][2].append(value)
+
+# Parts and children functions for the engine
+_statement_terms = attrgetter("subj", "obj")
+_triple_terms = attrgetter("subj", "pred", "obj")
+_tuple_terms = itemgetter(0, 2)
+_tuple_parts = itemgetter(0, 1, 2)
+_get_subj = attrgetter("subj")
+_get_pred = attrgetter("pred")
+_get_obj = attrgetter("obj")
+
+# Quoted triples in the subject and object of a triple
+def _quoted_triples(triple):
+    if triple._level == 0:
+        return ()
+    subj, obj = triple.subj, triple.obj
+    if isinstance(subj, RDF_Star_Triple):
+        if isinstance(obj, RDF_Star_Triple):
+            return (subj, obj)
+        return (subj,)
+    if isinstance(obj, RDF_Star_Triple):
+        return (obj,)
+    return ()
+
+# Subject and object of a triple, or nothing for other terms
+def _statement_children(term):
+    if isinstance(term, RDF_Star_Triple):
+        return (term.subj, term.obj)
+    return ()
+
+def _tuple_to_triple(term, subj, obj):
+    return RDF_Star_Triple(subj, term[1], obj)
+
+def _triple_to_tuple(triple, subj, obj):
+    return (subj, triple.pred, obj)
+
+def _triple_to_str(triple, subj, obj):
+    return "(" + subj + ", " + str(triple.pred) + ", " + obj + ")"
+
+# Tags of the reification triples for a star format
+def _reification_tags(star_format):
+    if star_format == "csv":
+        return (s_flag, p_flag, o_flag)
+    return (s_URI, p_URI, o_URI)
+
+# Standard reification of a non-RDF triple by recursion, giving the same
+# triples as _leaves on _reification_steps and _nested_reification_steps
+def _reify(triple, tags):
+    triples = []
+    new_terms = []
+    for term in (triple.subj, triple.obj):
+        if isinstance(term, RDF_Star_Triple):
+            term, reification = _quoted_blank_node(term, tags)
+            for reified in reification:
+                if reified._level == 0:
+                    triples.append(reified)
+                else:
+                    triples.extend(_reify(reified, (s_URI, p_URI, o_URI)))
+        new_terms.append(term)
+    triples.append(_live_triple(new_terms[0], triple.pred, new_terms[1]))
+    return triples
+
+# Steps of the standard reification of a non-RDF triple: the reification
+# triples of each quoted triple that has no blank node yet, then the triple
+# with its quoted triples replaced by blank nodes. Each blank node is only
+# looked up or minted once the earlier steps are fully decomposed
+def _reification_steps(triple, tags):
+    new_terms = []
+    for term in (triple.subj, triple.obj):
+        if isinstance(term, RDF_Star_Triple):
+            term, reification = _quoted_blank_node(term, tags)
+            yield from reification
+        new_terms.append(term)
+    yield _live_triple(new_terms[0], triple.pred, new_terms[1])
+    
+# Get the blank node of a quoted triple from bn_dict, and its reification
+# triples if it has just been minted (none otherwise)
+def _quoted_blank_node(quoted, tags):
+    blank, minted = _blank_node(quoted)
+    if not minted:
+        return blank, ()
+    s_tag, p_tag, o_tag = tags
+    return blank, (_live_triple(blank, s_tag, quoted.subj), _live_triple(blank, p_tag, quoted.pred),
+                   _live_triple(blank, o_tag, quoted.obj))
+
+# Get the blank node of a quoted triple from bn_dict, minting it if there is
+# none. Returns the blank node and whether it has just been minted
+def _blank_node(quoted):
+    blank = bn_dict.get(quoted)
+    if blank is not None:
+        # Use existing blank node
+        if metrics is not None:
+            metrics.count("bn_dict.hits")
+        return blank, False
+    
+    # Create blank node and add reference
+    if bn_names is None:
+        blank = Blank_Node()
+    else:
+        blank = Blank_Node(blank_node_name(quoted, bn_names))
+    bn_dict[quoted] = blank
+    if metrics is not None:
+        metrics.count("bn_dict.misses")
+        metrics.count("blank_nodes.minted")
+    return blank, True
+
+# Reification triples are decomposed again, always with URI tags
+def _nested_reification_steps(triple):
+    if triple._level == 0:
+        return ()
+    return _reification_steps(triple, (s_URI, p_URI, o_URI))
+
+# Steps of the shortcut algorithms for a non-RDF triple: the quoted triple
+# in the subject (or else the object), and the triples linking its subject
+# and object to the other end of the triple through a path relation
+# inverse is appended to the quoted relation on the link from its object
+def _shortcut_steps(triple, inverse=""):
+    subj, obj = triple.subj, triple.obj
+    if isinstance(subj, RDF_Star_Triple):
+        pred = subj.pred + "/" + triple.pred
+        inverse_pred = subj.pred + inverse + "/" + triple.pred
+        return (subj, _live_triple(subj.subj, pred, obj), _live_triple(subj.obj, inverse_pred, obj))
+    if isinstance(obj, RDF_Star_Triple):
+        pred = triple.pred + "/" + obj.pred
+        return (obj, _live_triple(subj, pred, obj.subj), _live_triple(subj, pred + inverse, obj.obj))
+    return ()
+
+def _shortcut_asym_steps(triple):
+    return _shortcut_steps(triple, "^-1")
+
+# Translation of a non-RDF triple by a shortcut algorithm, given its steps
+# The translation of the quoted triple comes from the translation cache
+def _shortcut_leaves(steps, shortcut_steps):
+    triples = list(_quoted_leaves(steps[0], shortcut_steps))
+    if steps[1]._level == 0 and steps[2]._level == 0:
+        triples.append(steps[1])
+        triples.append(steps[2])
+    else:
+        triples.extend(_leaves(steps[1:], shortcut_steps))
+    return triples
+
+# RDF* triples are immutable and their quoted triples are hash-consed:
+# a triple used as the subject or object of another one is swapped for the
+# live instance with the same contents, so quoted triples shared between
+# statements exist only once. Statements themselves are not interned, as
+# most of them (rebuilt from a graph's term IDs, or emitted by a
+# translation) are dropped straight away. Equality is structural, but
+# quoted triples compare by identity, so it only looks one level down
 class RDF_Star_Triple():
     
-    subj = None
-    pred = None
-    obj  = None
+    # Triples are kept in slots rather than an instance dict, which makes
+    # each triple about a quarter of the size
+    __slots__ = ("subj", "pred", "obj", "_hash", "_level", "__weakref__")
+    
+    # key: hash of a quoted triple, value: weak reference to the live quoted
+    # triple with those contents. Keying by the hash lets the table share
+    # the int with the triple instead of holding a tuple per entry. A plain
+    # dict is used as it is much faster to look up than a
+    # WeakValueDictionary, and entries are removed by _forget_triple when
+    # their triple dies
+    _instances = dict()
+    
+    # key: (subj, pred, obj), value: weak reference to the live quoted
+    # triple. Holds the rare triples whose hash is already taken by another
+    # triple
+    _collisions = dict()
     
     # Constructor for RDF* Triple. 3-tuples are used to denote nested RDF* triples
-    def __init__(self, subj, pred, obj): # recursive constructor
+    def __new__(cls, subj, pred, obj):
         if isinstance(subj, tuple):
-            self.subj = RDF_Star_Triple(subj[0], subj[1], subj[2])
-        else:
-            self.subj = subj
-        
-        self.pred = pred
-        
+            subj = _fold(subj, _tuple_terms, _tuple_to_triple, tuple)
         if isinstance(obj, tuple):
-            self.obj = RDF_Star_Triple(obj[0], obj[1], obj[2])
-        else:
-            self.obj  = obj
+            obj = _fold(obj, _tuple_terms, _tuple_to_triple, tuple)
             
-    # Set the subject of the RDF* triple
-    def setSubject(self, subj):
-        if isinstance(subj, tuple):
-            self.subj = RDF_Star_Triple(subj[0], subj[1], subj[2])
-        else:
-            self.subj = subj
+        # Quoted triples are always built first, so the nesting level is
+        # known without walking down the triple
+        level = 0
+        if isinstance(subj, RDF_Star_Triple):
+            subj = _intern_triple(subj)
+            level = subj._level + 1
+        if isinstance(obj, RDF_Star_Triple):
+            obj = _intern_triple(obj)
+            if obj._level >= level:
+                level = obj._level + 1
+                
+        triple = object.__new__(cls)
+        _set_subj(triple, subj)
+        _set_pred(triple, pred)
+        _set_obj(triple, obj)
+        _set_hash(triple, hash((subj, pred, obj)))
+        _set_level(triple, level)
+        return triple
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("RDF_Star_Triple is immutable")
+    
+    # Rebuild through the constructor so unpickled triples are hash-consed too
+    # Nested triples are pickled as a flat tsv row, as pickling the quoted
+    # triples one inside the other would recurse once per level
+    def __reduce__(self):
+        if self._level > 1:
+            return (_row_to_triple, (triple_to_ntx(self),))
+        return (RDF_Star_Triple, (self.subj, self.pred, self.obj))
             
-    # Set the predicate of the RDF* triple
+    # Triples cannot be changed in place. The setters raise rather than
+    # return a changed copy, which a caller expecting the triple itself to
+    # change would silently drop
+    def setSubject(self, subj):
+        raise AttributeError("RDF_Star_Triple is immutable, use withSubject")
+    
     def setPredicate(self, pred):
-        self.pred = pred
-            
-    # Set the object of the RDF* triple
+        raise AttributeError("RDF_Star_Triple is immutable, use withPredicate")
+    
     def setObject(self, obj):
-        if isinstance(obj, tuple):
-            self.obj = RDF_Star_Triple(obj[0], obj[1], obj[2])
-        else:
-            self.obj  = obj
-            
-    # Replace old entity name with new entity name
+        raise AttributeError("RDF_Star_Triple is immutable, use withObject")
+    
     def replaceAll(self, old, new):
-        if self.subj == old:
-            self.subj = new
-        elif isinstance(self.subj, RDF_Star_Triple):
-            self.subj.replaceAll(old, new)
+        raise AttributeError("RDF_Star_Triple is immutable, use withReplaced")
+            
+    # Get a copy of the triple with a new subject
+    def withSubject(self, subj):
+        return RDF_Star_Triple(subj, self.pred, self.obj)
             
-        if self.obj == old:
-            self.obj = new
-        elif isinstance(self.obj, RDF_Star_Triple):
-            self.obj.replaceAll(old, new)
+    # Get a copy of the triple with a new predicate
+    def withPredicate(self, pred):
+        return RDF_Star_Triple(self.subj, pred, self.obj)
+            
+    # Get a copy of the triple with a new object
+    def withObject(self, obj):
+        return RDF_Star_Triple(self.subj, self.pred, obj)
+            
+    # Get a copy of the triple with old entity name replaced by new entity name
+    def withReplaced(self, old, new):
+        if self._level > 1:
+            def replace(term):
+                return new if term == old else term
+            
+            def rebuild(triple, subj, obj):
+                if triple == old and triple is not self:
+                    return new
+                return RDF_Star_Triple(subj, triple.pred, obj)
+            
+            return _fold(self, _statement_terms, rebuild, RDF_Star_Triple, replace)
+        
+        subj, obj = self.subj, self.obj
+        
+        if subj == old:
+            subj = new
+        elif isinstance(subj, RDF_Star_Triple):
+            subj = subj.withReplaced(old, new)
+            
+        if obj == old:
+            obj = new
+        elif isinstance(obj, RDF_Star_Triple):
+            obj = obj.withReplaced(old, new)
+            
+        return RDF_Star_Triple(subj, self.pred, obj)
             
     # Check is an RDF* triple is also an RDF triple
     def isRDFTriple(self):
-        return not isinstance(self.subj, RDF_Star_Triple) and not isinstance(self.obj, RDF_Star_Triple)
+        return self._level == 0
             
     # Check how many triples deep is the RDF* triple
     def level(self): 
-        if not isinstance(self.subj, RDF_Star_Triple) and not isinstance(self.obj, RDF_Star_Triple):
-            return 0
-        elif not isinstance(self.subj, RDF_Star_Triple):
-            return 1 + self.obj.level()    
-        elif not isinstance(self.obj, RDF_Star_Triple):
-            return 1 + self.subj.level()
-        else:
-            return 1 + max(self.subj.level(), self.obj.level())
+        return self._level
         
-    # Get the quoted triple(s) (one level down) in the RDF* triple
+    # Get the quoted triple(s) (at any depth) in the RDF* triple, in order
     def getQuotedTriples(self):
-        quoted_triples = list()
-        # Case where subject is a quoted triple
-        if isinstance(self.subj, RDF_Star_Triple):
-            quoted_triples.append(self.subj)
-            if (not self.subj.isRDFTriple()):
-                quoted_triples.extend(self.subj.getQuotedTriples())
-        # Case where object is a quoted triple
-        if isinstance(self.obj, RDF_Star_Triple):
-            quoted_triples.append(self.obj)
-            if (not self.obj.isRDFTriple()):
-                quoted_triples.extend(self.obj.getQuotedTriples())
+        quoted = _quoted_triples(self)
+        if self._level > _max_recursion_level:
+            return _visit(quoted, _quoted_triples)
+        if self._level == 1:
+            return list(quoted)
+        quoted_triples = []
+        for triple in quoted:
+            quoted_triples.append(triple)
+            if triple._level > 0:
+                quoted_triples.extend(triple.getQuotedTriples())
         return quoted_triples
         
     # Get the core facts from the RDF* triple
@@ -102,442 +482,2605 @@ class RDF_Star_Triple():
     # Get the deepest triples. For regular RDF, just return the same one.
     # Part of unqualification algorithm
     def getDeepestTriples(self):
-        if self.isRDFTriple():
-            return [RDF_Star_Triple(self.subj, self.pred, self.obj)]
-        else:
-            deepest = list()
-            if isinstance(self.subj, RDF_Star_Triple):
-                deepest.extend(self.subj.getDeepestTriples())
-            if isinstance(self.obj, RDF_Star_Triple):
-                deepest.extend(self.obj.getDeepestTriples())
+        if self._level > 1:
+            deepest = []
+            for quoted in _quoted_triples(self):
+                deepest.extend(_quoted_leaves(quoted, _quoted_triples))
             return deepest
+        elif self._level == 1:
+            return list(_quoted_triples(self))
+        return [self]
     
     # decompose RDF* triple
     # input: RDF* triple
     # output: set of RDF triples
     # Decompose an RDF* triple based on standard reification
+    # Quoted triples are reified with the tags of the star format, and the
+    # triples nested inside them with the URI tags
     def decompose(self, star_format="n-triples"):
-        if star_format == "csv":
-            s_tag, p_tag, o_tag = s_flag, p_flag, o_flag
+        if self._level == 0:
+            # So the given triple is an RDF triple itself
+            return [self]
+        if self._level > _max_recursion_level:
+            return _leaves(_reification_steps(self, _reification_tags(star_format)), _nested_reification_steps)
+        return _reify(self, _reification_tags(star_format))
+        
+    # Decompose an RDF* triple based on symmetrical shortcut algorithm
+    def shortDecompose(self):
+        if self._level == 0:
+            return [self]
+        return _shortcut_leaves(_shortcut_steps(self), _shortcut_steps)
+        
+    # Decompose an RDF* triple based on asymmetrical shortcut algorithm
+    def shortDecomposeV2(self):
+        if self._level == 0:
+            return [self]
+        return _shortcut_leaves(_shortcut_asym_steps(self), _shortcut_asym_steps)
+        
+    def convertToTuple(self):    
+        if self._level > _max_recursion_level:
+            return _fold(self, _statement_terms, _triple_to_tuple, RDF_Star_Triple)
+        
+        subj, obj = self.subj, self.obj
+        if isinstance(subj, RDF_Star_Triple):
+            subj = subj.convertToTuple()
+        if isinstance(obj, RDF_Star_Triple):
+            obj = obj.convertToTuple()
+        return (subj, self.pred, obj)
+        
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, RDF_Star_Triple) or self._hash != other._hash:
+            return False
+        return self.subj == other.subj and self.pred == other.pred and self.obj == other.obj
+    
+    def __hash__(self):
+        return self._hash
+        
+    def __str__(self):
+        if self._level > _max_recursion_level:
+            return _fold(self, _statement_terms, _triple_to_str, RDF_Star_Triple, str)
+        return "(" + str(self.subj) + ", " + str(self.pred) + ", " + str(self.obj) + ")"
+    
+# Slot setters for the RDF_Star_Triple constructor, which cannot assign
+# attributes normally as __setattr__ is blocked
+_set_subj = RDF_Star_Triple.subj.__set__
+_set_pred = RDF_Star_Triple.pred.__set__
+_set_obj = RDF_Star_Triple.obj.__set__
+_set_hash = RDF_Star_Triple._hash.__set__
+_set_level = RDF_Star_Triple._level.__set__
+
+# Build a statement from terms whose quoted triples are live instances
+# already, such as the terms of a Term_Dictionary, without interning them
+# again as the constructor would
+def _live_triple(subj, pred, obj):
+    level = 0
+    if isinstance(subj, RDF_Star_Triple):
+        level = subj._level + 1
+    if isinstance(obj, RDF_Star_Triple) and obj._level >= level:
+        level = obj._level + 1
+    triple = object.__new__(RDF_Star_Triple)
+    _set_subj(triple, subj)
+    _set_pred(triple, pred)
+    _set_obj(triple, obj)
+    _set_hash(triple, hash((subj, pred, obj)))
+    _set_level(triple, level)
+    return triple
+    
+# Get the live instance of a quoted triple, making the triple the live one
+# if there is none
+def _intern_triple(triple):
+    instances = RDF_Star_Triple._instances
+    ref = instances.get(triple._hash)
+    live = ref() if ref is not None else None
+    if live is triple:
+        return triple
+    if live is not None and live == triple:
+        return live
+    
+    collisions = RDF_Star_Triple._collisions
+    key = (triple.subj, triple.pred, triple.obj)
+    if collisions:
+        collided = collisions.get(key)
+        collided = collided() if collided is not None else None
+        if collided is not None:
+            return collided
+    if live is None:
+        instances[triple._hash] = weakref.KeyedRef(triple, _forget_triple, triple._hash)
+    else:
+        # The hash is taken by a different triple
+        collisions[key] = weakref.KeyedRef(triple, _forget_collision, key)
+    return triple
+    
+# Remove the entry of a dead triple, unless a new triple has taken its place
+def _forget_triple(ref):
+    instances = RDF_Star_Triple._instances
+    if instances.get(ref.key) is ref:
+        del instances[ref.key]
+        
+def _forget_collision(ref):
+    collisions = RDF_Star_Triple._collisions
+    if collisions.get(ref.key) is ref:
+        del collisions[ref.key]
+    
+# Labels of unnamed blank nodes. Unlike id(), a label is never handed out
+# twice within a translation run, even after its blank node has been garbage
+# collected. Each run starts again from 0, see _translation_run, so the
+# same input always gives the same output
+_blank_node_labels = count()
+
+# Intermediate node object
+# Named blank nodes are equal to every other blank node with the same name,
+# which lets blank nodes minted in different processes be matched up.
+# Unnamed blank nodes, which a single process translation mints, get an
+# integer label instead, and are written as "_" followed by the label,
+# which cannot clash with the hex names from blank_node_name
+class Blank_Node():
+    
+    __slots__ = ("name", "label", "_str")
+    
+    def __init__(self, name=None):
+        self.name = name
+        if name is None:
+            self.label = next(_blank_node_labels)
+            self._str = "_:" + "bNode_" + str(self.label)
         else:
-            s_tag, p_tag, o_tag = s_URI, p_URI, o_URI
+            self.label = None
+            self._str = "_:" + "bNode" + name
         
-        triples = list()
-        if self.isRDFTriple():
-            # So the given triple is an RDF triple itself
-            triples.append(RDF_Star_Triple(self.subj, self.pred, self.obj))
-            
+    def __eq__(self, other):
+        if self.name is None or not isinstance(other, Blank_Node):
+            return self is other
+        return self.name == other.name
+    
+    def __hash__(self):
+        if self.name is None:
+            return id(self)
+        return hash(self.name)
+        
+    def __str__(self):
+        return self._str
+    
+# Run a translation from a fresh blank node state: an empty bn_dict, labels
+# counted from 0 and no content names. The output then does not depend on
+# what was translated before in the process. The previous state is put back
+# at the end of the run
+@contextmanager
+def _translation_run():
+    global bn_dict, bn_names, _blank_node_labels
+    previous = bn_dict, bn_names, _blank_node_labels
+    bn_dict, bn_names, _blank_node_labels = dict(), None, count()
+    try:
+        yield
+    finally:
+        bn_dict, bn_names, _blank_node_labels = previous
+    
+# Name for the blank node of a quoted triple, taken from a SHA-256 hash of
+# its contents. Every process names the same quoted triple the same way
+# The hash covers the names of the triples quoted inside it rather than
+# their text, as in a Merkle tree, so each quoted triple is only hashed
+# once however deep it is nested. names keeps the names computed so far,
+# key: quoted triple, value: name
+def blank_node_name(quoted_triple, names=None):
+    if names is None:
+        names = dict()
+    stack = [quoted_triple]
+    while stack:
+        triple = stack[-1]
+        if triple in names:
+            stack.pop()
+            continue
+        missing = [term for term in (triple.subj, triple.obj) 
+                   if isinstance(term, RDF_Star_Triple) and term not in names]
+        if missing:
+            stack.extend(missing)
+            continue
+        
+        stack.pop()
+        parts = []
+        for term in (triple.subj, triple.pred, triple.obj):
+            if isinstance(term, RDF_Star_Triple):
+                parts.append("<" + names[term] + ">")
+            else:
+                # Length prefixed, so parts cannot run into each other
+                term = str(term)
+                parts.append(str(len(term)) + ":" + term)
+        names[triple] = hashlib.sha256("".join(parts).encode('utf-8')).hexdigest()
+    return names[quoted_triple]
+
+# Blank node written in a row by its name from blank_node_name
+_row_blank_node_re = re.compile(r'_:bNode([0-9a-f]{64})')
+
+# Get the blank node of a term in a row, or the term itself if it is not
+# a blank node named by blank_node_name
+def _row_blank_node(text):
+    match = _row_blank_node_re.fullmatch(text)
+    if match is None:
+        return text
+    return Blank_Node(match.group(1))
+
+# LRU cache of the translations of quoted triples. A base fact is often
+# quoted by many statements, and the algorithms that expand quoted triples
+# (unqualification and the shortcut algorithms) would otherwise expand it
+# again for each of them. Translations are tuples of RDF triples, keyed by
+# the children function of the algorithm and the quoted triple, which is a
+# lookup by identity as triples are hash-consed
+# max_size bounds the number of cached RDF triples. The least recently
+# used translations are evicted first, and translations larger than the
+# bound are not cached
+class Translation_Cache():
+    
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.entries = OrderedDict()    # key: (children function, quoted triple), value: RDF triples
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        
+    # Get a cached translation, or None
+    def get(self, key):
+        triples = self.entries.get(key)
+        if triples is None:
+            self.misses += 1
+            if metrics is not None:
+                metrics.count("translation_cache.misses")
         else:
-            # Create a new triple template
-            new_triple = RDF_Star_Triple(None, self.pred, None)
-            
-            if (isinstance(self.subj, RDF_Star_Triple)):
-                # So the subject is an RDF* triple
-                if str(self.subj) in bn_dict:
-                    # Use existing blank node
-                    blank = bn_dict[str(self.subj)]
-                    
-                else:
-                    # Create blank node and add reference
-                    blank = Blank_Node()
-                    bn_dict[str(self.subj)] = blank
-                
-                    # Spawn some new triples
-                    s_triple = RDF_Star_Triple(blank, s_tag, self.subj.subj)
-                    p_triple = RDF_Star_Triple(blank, p_tag, self.subj.pred)
-                    o_triple = RDF_Star_Triple(blank, o_tag, self.subj.obj)
-
-                    # Decompose, then add to list of triples
-                    triples.extend(s_triple.decompose())
-                    triples.append(p_triple)
-                    triples.extend(o_triple.decompose())
+            self.entries.move_to_end(key)
+            self.hits += 1
+            if metrics is not None:
+                metrics.count("translation_cache.hits")
+        return triples
+    
+    def put(self, key, triples):
+        if len(triples) > self.max_size:
+            return
+        self.entries[key] = triples
+        self.size += len(triples)
+        while self.size > self.max_size:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+            self.evictions += 1
+            _count("translation_cache.evictions")
+            
+    # Drop all translations and reset the statistics
+    def clear(self):
+        self.entries.clear()
+        self.size = self.hits = self.misses = self.evictions = 0
+        
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, 
+                "entries": len(self.entries), "size": self.size}
+        
+    def __len__(self):
+        return len(self.entries)
+
+# Translation cache used by the algorithms, or None for no caching
+translation_cache = Translation_Cache()
+
+# Set the translation cache (or None to stop caching). Returns the previous one
+def set_translation_cache(new_cache):
+    global translation_cache
+    previous = translation_cache
+    translation_cache = new_cache
+    return previous
+
+# Translation of a quoted triple on the traversal engine, given the
+# children function of the algorithm. Goes through the translation cache
+def _quoted_leaves(quoted, children):
+    if quoted._level == 0:
+        return (quoted,)
+    cache = translation_cache
+    if cache is None:
+        return _leaves((quoted,), children)
+    
+    key = (children, quoted)
+    triples = cache.get(key)
+    if triples is None:
+        triples = tuple(_leaves((quoted,), children))
+        cache.put(key, triples)
+    return triples
+    
+# Translation algorithms for a single RDF* triple. These are shared by the
+# graph translation methods and the streaming translation, and each one
+# returns the list of RDF triples the RDF* triple translates to
+
+# Unqualiification algorithm
+def unqualify_triple(star_triple, star_format=None):
+    return star_triple.getDeepestTriples()
+
+# Standard reification
+def std_reify_triple(star_triple, star_format="n-triples"):
+    if star_triple.isRDFTriple():
+        return [star_triple]
+    return star_triple.decompose(star_format=star_format)
+
+# Standard reification + unqualification
+def std_reify_plus_triple(star_triple, star_format="n-triples"):
+    if star_triple.isRDFTriple():
+        return [star_triple]
+    return star_triple.decompose(star_format=star_format) + star_triple.getDeepestTriples()
+
+# Symmetrical shortcut algorithm
+def shortcut_triple(star_triple, star_format=None):
+    return star_triple.shortDecompose()
+
+# Asymmetrical shortcut algorithm
+def shortcut_asym_triple(star_triple, star_format=None):
+    return star_triple.shortDecomposeV2()
+
+# Extended reification (symmetrical version)
+def ext_reify_sym_triple(star_triple, star_format="n-triples"):
+    if star_triple.isRDFTriple():
+        return [star_triple]
+    return star_triple.decompose(star_format=star_format) + star_triple.shortDecompose()
+
+# Extended reification (asymmetrical version), aka ExtRet
+def extret_triple(star_triple, star_format="n-triples"):
+    if star_triple.isRDFTriple():
+        return [star_triple]
+    return star_triple.decompose(star_format=star_format) + star_triple.shortDecomposeV2()
+
+# key: name of translation algorithm, value: single triple translation function
+translation_algos = {
+    "unqualiification": unqualify_triple,
+    "std_reification": std_reify_triple,
+    "std_reification_plus": std_reify_plus_triple,
+    "shortcut_symmetric": shortcut_triple,
+    "shortcut_asymmetric": shortcut_asym_triple,
+    "ext_reification_symmetric": ext_reify_sym_triple,
+    "ext_reification": extret_triple,
+    "extret": extret_triple,
+}
+
+# key: name of translation algorithm, value: names of the algorithms whose
+# translations of a non-RDF triple it puts together, in order. Every other
+# algorithm is made of its own translation only
+composite_algos = {
+    "std_reification_plus": ("std_reification", "unqualiification"),
+    "ext_reification_symmetric": ("std_reification", "shortcut_symmetric"),
+    "ext_reification": ("std_reification", "shortcut_asymmetric"),
+    "extret": ("std_reification", "shortcut_asymmetric"),
+}
+
+# Dictionary of all terms in a graph. IRIs, literals and blank nodes are
+# mapped to integer IDs, and quoted triples get their own IDs in the same
+# space, stored as a tuple of the IDs of their subject, predicate and object
+class Term_Dictionary():
+    
+    def __init__(self):
+        self.terms = []           # key: term ID, value: term or (s, p, o) ID tuple
+        self.term_ids = dict()    # key: term or (s, p, o) ID tuple, value: term ID
+        self.triples = dict()     # key: quoted triple ID, value: live RDF* triple, kept once looked up
+        
+    # Get the ID of a term, adding it to the dictionary if it is new
+    # Quoted triples are added after the terms inside them
+    def intern(self, term):
+        if isinstance(term, RDF_Star_Triple):
+            if term._level > 1:
+                return _fold(term, _triple_terms, self.__internQuoted, RDF_Star_Triple, self.intern)
+            term = (self.intern(term.subj), self.intern(term.pred), self.intern(term.obj))
+        
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            term_id = len(self.terms)
+            self.terms.append(term)
+            self.term_ids[term] = term_id
+        return term_id
+    
+    def __internQuoted(self, triple, subj_id, pred_id, obj_id):
+        return self.intern((subj_id, pred_id, obj_id))
+    
+    # Get the ID of a term in tuple format, as read by read_triples, with
+    # quoted triples as 3-tuples. No RDF* triples are built for them
+    def internTuple(self, term):
+        if not isinstance(term, tuple):
+            return self.intern(term)
+        subj, pred, obj = term
+        if isinstance(subj, tuple) or isinstance(obj, tuple) or isinstance(pred, tuple):
+            return _fold(term, _tuple_parts, self.__internQuoted, tuple, self.intern)
+        return self.intern((self.intern(subj), self.intern(pred), self.intern(obj)))
+    
+    # Get the ID of a term without adding it. Returns None for unknown terms
+    def find(self, term):
+        if isinstance(term, RDF_Star_Triple):
+            if term._level > 1:
+                return _fold(term, _triple_terms, self.__findQuoted, RDF_Star_Triple, self.term_ids.get)
+            return self.__findQuoted(term, self.find(term.subj), self.find(term.pred), self.find(term.obj))
+        return self.term_ids.get(term)
+    
+    def __findQuoted(self, triple, subj_id, pred_id, obj_id):
+        if subj_id is None or pred_id is None or obj_id is None:
+            return None
+        return self.term_ids.get((subj_id, pred_id, obj_id))
+    
+    # Check if the ID belongs to a quoted triple
+    def isQuoted(self, term_id):
+        return isinstance(self.terms[term_id], tuple)
+    
+    # Get the IDs of the entities of a statement, at any nesting depth,
+    # without duplicates and in order of appearance
+    # The quoted triple IDs still to be walked are kept on an explicit stack
+    def statementEntities(self, subj_id, obj_id):
+        terms = self.terms
+        entities = dict()   # Used as an ordered set
+        stack = [obj_id, subj_id]
+        while stack:
+            term_id = stack.pop()
+            term = terms[term_id]
+            if isinstance(term, tuple):
+                stack.append(term[2])
+                stack.append(term[0])
+            else:
+                entities[term_id] = None
+        return entities
+    
+    # Get the IDs of the relations of a statement, at any nesting depth,
+    # without duplicates and in order of appearance
+    def statementRelations(self, subj_id, pred_id, obj_id):
+        terms = self.terms
+        relations = {pred_id: None}   # Used as an ordered set
+        stack = [obj_id, subj_id]
+        while stack:
+            term = terms[stack.pop()]
+            if isinstance(term, tuple):
+                relations[term[1]] = None
+                stack.append(term[2])
+                stack.append(term[0])
+        return relations
+    
+    # Get the term for an ID. Quoted triples are rebuilt as RDF* triples the
+    # first time they are looked up, and kept in triples after that
+    def lookup(self, term_id):
+        term = self.terms[term_id]
+        if isinstance(term, tuple):
+            triple = self.triples.get(term_id)
+            if triple is None:
+                triple = self.__rebuild(term_id)
+            return triple
+        return term
+    
+    # Rebuild a quoted triple, and any quoted triples inside it that are not
+    # kept yet, bottom-up on an explicit stack
+    def __rebuild(self, term_id):
+        terms = self.terms
+        triples = self.triples
+        stack = [term_id]
+        while stack:
+            ids = terms[stack[-1]]
+            missing = [part for part in ids if isinstance(terms[part], tuple) and part not in triples]
+            if missing:
+                stack.extend(missing)
+                continue
+            parts = [triples[part] if isinstance(terms[part], tuple) else terms[part] for part in ids]
+            triples[stack.pop()] = _intern_triple(RDF_Star_Triple(parts[0], parts[1], parts[2]))
+        return triples[term_id]
+    
+    def __len__(self):
+        return len(self.terms)
+    
+# Binary graph files start with this, followed by the number of statements,
+# the number of terms and the size of the encoded terms, as little-endian
+# 64-bit integers. Then come the subject, predicate and object ID columns,
+# the encoded terms, and the offset of each encoded term (plus the end)
+_binary_magic = b"RDFSTAR\x01"
+_binary_header = struct.Struct('<qqq')
+_quoted_ids = struct.Struct('<qqq')
+
+# Encode a term for a binary graph file. The first byte gives the kind of term
+def _encode_term(term, term_id):
+    if isinstance(term, tuple):
+        return b'Q' + _quoted_ids.pack(term[0], term[1], term[2])
+    elif isinstance(term, Blank_Node):
+        # Labels are only unique within a translation run, and a graph can
+        # hold blank nodes of several runs or files. Blank nodes other than
+        # those named by blank_node_name are stored as "_" and their term ID,
+        # which is unique in the file
+        name = term.name
+        if name is None or _file_blank_node_re.fullmatch(name):
+            name = "_" + str(term_id)
+        return b'B' + name.encode('utf-8')
+    elif isinstance(term, str):
+        return b'S' + term.encode('utf-8')
+    elif term is None:
+        return b'N'
+    raise ValueError("Cannot store term of type " + type(term).__name__)
+
+# Names of blank nodes loaded from a file, see Mapped_Terms
+_file_blank_node_re = re.compile(r'_F\d+_\d+')
+
+# Count of the binary graph files loaded, which keeps the blank nodes of
+# different files apart
+_loaded_files = count()
+
+# Get 64-bit IDs from a mapped file. The IDs are copied only on big-endian
+# machines, which need the bytes swapped
+def _mapped_ids(view):
+    ids = view.cast('q')
+    if sys.byteorder == 'big':
+        ids = array('q', ids)
+        ids.byteswap()
+    return ids
+
+# Terms of a binary graph file, decoded from the mapped file when looked up
+# New terms are kept in a list after the stored ones. Blank nodes stored
+# under a label are renamed into a namespace of their own for each loaded
+# file, e.g. _:bNode_F0_3, so they never clash with blank nodes minted
+# by a translation or loaded from another file
+class Mapped_Terms():
+    
+    def __init__(self, offsets, encoded):
+        self.offsets = offsets
+        self.encoded = encoded
+        self.stored = len(offsets) - 1
+        self.added = []
+        self.blank_node_prefix = "_F" + str(next(_loaded_files))
+        
+    def __getitem__(self, term_id):
+        if term_id >= self.stored:
+            return self.added[term_id - self.stored]
+        
+        start = self.offsets[term_id]
+        kind = self.encoded[start]
+        if kind == 81:    # Q
+            return _quoted_ids.unpack_from(self.encoded, start + 1)
+        
+        text = str(self.encoded[start + 1:self.offsets[term_id + 1]], 'utf-8')
+        if kind == 83:    # S
+            return text
+        elif kind == 66:  # B
+            if text.startswith("_"):
+                return Blank_Node(self.blank_node_prefix + text)
+            return Blank_Node(text)
+        return None
+    
+    def __iter__(self):
+        for term_id in range(len(self)):
+            yield self[term_id]
+    
+    def __len__(self):
+        return self.stored + len(self.added)
+    
+    def append(self, term):
+        self.added.append(term)
+
+# Term dictionary of a binary graph file. The term to ID map is only built
+# when it is first needed, e.g. to add triples or look up entities
+class Mapped_Term_Dictionary(Term_Dictionary):
+    
+    def __init__(self, terms):
+        self.terms = terms
+        self.triples = dict()
+        
+    def __getattr__(self, name):
+        if name == "term_ids":
+            self.term_ids = {term: term_id for term_id, term in enumerate(self.terms)}
+            return self.term_ids
+        raise AttributeError(name)
+        
+# Permutation indexes of a graph, used by RDF_Star_Graph.match. Each maps
+# the ID of one term of a statement to the IDs of a second term, and those
+# to the positions of the statements with both, in graph order
+#   spo: subject -> predicate -> positions
+#   pos: predicate -> object -> positions
+#   osp: object -> subject -> positions
+# Quoted triples are keys like any other term. The quoted triple IDs used
+# as subjects and objects are also listed, for nested patterns
+class Pattern_Index():
+    
+    def __init__(self):
+        self.spo = dict()
+        self.pos = dict()
+        self.osp = dict()
+        self.quoted_subj_ids = array('q')
+        self.quoted_obj_ids = array('q')
+        
+    def add(self, terms, position, subj_id, pred_id, obj_id):
+        if subj_id not in self.spo and terms.isQuoted(subj_id):
+            self.quoted_subj_ids.append(subj_id)
+        if obj_id not in self.osp and terms.isQuoted(obj_id):
+            self.quoted_obj_ids.append(obj_id)
+            
+        for index, first, second in ((self.spo, subj_id, pred_id), (self.pos, pred_id, obj_id),
+                                     (self.osp, obj_id, subj_id)):
+            inner = index.get(first)
+            if inner is None:
+                index[first] = {second: array('q', (position,))}
+            elif second in inner:
+                inner[second].append(position)
+            else:
+                inner[second] = array('q', (position,))
                 
-                new_triple.setSubject(blank)
+    # Get the position runs of the statements with any of the first IDs
+    # and any of the second IDs (None for any ID at all) in an index
+    @staticmethod
+    def runs(index, first_ids, second_ids):
+        runs = []
+        for first in first_ids:
+            inner = index.get(first)
+            if inner is None:
+                continue
+            if second_ids is None:
+                runs.extend(inner.values())
+                continue
+            for second in second_ids:
+                if second in inner:
+                    runs.append(inner[second])
+        return runs
+    
+def _pattern_parts(term):
+    return term if isinstance(term, tuple) else ()
+
+# Check if a term of a match pattern is a nested pattern, i.e. a 3-tuple
+# with a None wildcard somewhere inside it
+def _is_pattern(term):
+    return isinstance(term, tuple) and any(part is None for part in _visit(term, _pattern_parts))
+
+# Check if the term with the given ID matches a nested pattern
+def _matches_pattern(terms, term_id, pattern):
+    stack = [(term_id, pattern)]
+    while stack:
+        term_id, pattern = stack.pop()
+        if pattern is None:
+            continue
+        if isinstance(pattern, tuple):
+            term = terms.terms[term_id]
+            if not isinstance(term, tuple):
+                return False
+            stack.extend(zip(term, pattern))
+        elif term_id != terms.find(pattern):
+            return False
+    return True
+
+class RDF_Star_Graph():
+    
+    # Triples are stored as three columns of term IDs. The term dictionary
+    # can be shared between graphs by passing it in
+    def __init__(self, terms=None):
+        self.terms = Term_Dictionary() if terms is None else terms
+        self.subj_ids = array('q')
+        self.pred_ids = array('q')
+        self.obj_ids  = array('q')
+        self.__clearIndexes()
+        
+    # Entity and relation indexes, built on first use and then kept up to
+    # date on every add, so graphs that are never queried (such as the
+    # output of a translation) do not pay for them
+    # Entity index key: term ID, value: positions of the statements it 
+    # appears in, at any depth
+    # Relation index key: term ID, value: number of statements it appears in
+    # The ID arrays hold the same IDs in order of first appearance
+    def __clearIndexes(self):
+        for name in ("entity_index", "relation_index", "entity_ids", "relation_ids"):
+            self.__dict__.pop(name, None)
+        self.__indexed = False
+        self.pattern_index = None
+        
+    def __getattr__(self, name):
+        if name in ("entity_index", "relation_index", "entity_ids", "relation_ids"):
+            self.__reindex()
+            return getattr(self, name)
+        raise AttributeError(name)
+        
+    def __reindex(self):
+        self.entity_index = dict()
+        self.relation_index = dict()
+        self.entity_ids = array('q')
+        self.relation_ids = array('q')
+        self.__indexed = True
+        for i in range(len(self.subj_ids)):
+            self.__indexEntities(i, self.subj_ids[i], self.pred_ids[i], self.obj_ids[i])
+        
+    # Add the statement at the given position to the indexes that are built
+    def __index(self, position, subj_id, pred_id, obj_id):
+        if self.__indexed:
+            self.__indexEntities(position, subj_id, pred_id, obj_id)
+        if self.pattern_index is not None:
+            self.pattern_index.add(self.terms, position, subj_id, pred_id, obj_id)
+            
+    def __indexEntities(self, position, subj_id, pred_id, obj_id):
+        terms = self.terms
+        entity_index = self.entity_index
+        relation_index = self.relation_index
+        
+        if not (terms.isQuoted(subj_id) or terms.isQuoted(obj_id)):
+            # Fast path for RDF triples
+            entities = (subj_id,) if subj_id == obj_id else (subj_id, obj_id)
+            relations = (pred_id,)
+        else:
+            entities = terms.statementEntities(subj_id, obj_id)
+            relations = terms.statementRelations(subj_id, pred_id, obj_id)
+            
+        for ent in entities:
+            if ent in entity_index:
+                entity_index[ent].append(position)
+            else:
+                entity_index[ent] = array('q', (position,))
+                self.entity_ids.append(ent)
                 
+        for rel in relations:
+            if rel in relation_index:
+                relation_index[rel] += 1
             else:
-                new_triple.setSubject(self.subj)
+                relation_index[rel] = 1
+                self.relation_ids.append(rel)
                 
-            if (isinstance(self.obj, RDF_Star_Triple)):
-                # So the object is an RDF* triple
-                if str(self.obj) in bn_dict:
-                    # Use existing blank node
-                    blank = bn_dict[str(self.obj)]
+    # Store a statement given the IDs of its terms
+    def __append(self, subj_id, pred_id, obj_id):
+        if not isinstance(self.subj_ids, array):
+            self.__unmap()
+        if self.__indexed or self.pattern_index is not None:
+            self.__index(len(self.subj_ids), subj_id, pred_id, obj_id)
+        self.subj_ids.append(subj_id)
+        self.pred_ids.append(pred_id)
+        self.obj_ids.append(obj_id)
+        
+    # All RDF* triples in the graph, rebuilt from the term IDs. A tuple, so
+    # that appending to it fails instead of leaving the graph unchanged
+    @property
+    def triples_list(self):
+        return tuple(self)
+    
+    # Get the RDF* triple at the given position
+    def getTriple(self, index):
+        lookup = self.terms.lookup
+        return _live_triple(lookup(self.subj_ids[index]), lookup(self.pred_ids[index]), lookup(self.obj_ids[index]))
+    
+    # Generate the RDF* triples of the graph in order, rebuilt from the term
+    # IDs. Quoted triples come from the term dictionary, so only the
+    # statements themselves are built
+    def iterTriples(self):
+        terms = self.terms.terms
+        lookup = self.terms.lookup
+        for subj_id, pred_id, obj_id in zip(self.subj_ids, self.pred_ids, self.obj_ids):
+            subj, pred, obj = terms[subj_id], terms[pred_id], terms[obj_id]
+            if isinstance(subj, tuple):
+                subj = lookup(subj_id)
+            if isinstance(pred, tuple):
+                pred = lookup(pred_id)
+            if isinstance(obj, tuple):
+                obj = lookup(obj_id)
+            yield _live_triple(subj, pred, obj)
+        
+    # Add an RDF* triple to the knowledge graph
+    # The graph only stores term IDs, so the triple is never kept by reference
+    # and copy is kept for compatibility
+    def add(self, triple, copy=True):
+        terms = self.terms
+        if isinstance(triple, tuple):
+            # Triple is a tuple, Tuple should have three elements. Its terms
+            # are interned as they are, without building an RDF* triple
+            self.__append(terms.internTuple(triple[0]), terms.intern(triple[1]), terms.internTuple(triple[2]))
+            
+        elif isinstance(triple, RDF_Star_Triple):
+            self.__append(terms.intern(triple.subj), terms.intern(triple.pred), terms.intern(triple.obj))
+
+    # Add list of triples to the knowledge graph          
+    # For RDF* triples only, NO TUPLES
+    def addAll(self, t_list):
+        intern = self.terms.intern
+        if self.__indexed or self.pattern_index is not None or not isinstance(self.subj_ids, array):
+            for triple in t_list:
+                self.__append(intern(triple.subj), intern(triple.pred), intern(triple.obj))
+            return
+        
+        # Nothing to index, so the IDs go straight into the columns, a batch
+        # of triples at a time. Terms already in the dictionary are found
+        # with a plain lookup, which never matches an RDF* triple as quoted
+        # triples are keyed by their ID tuple, and only the rest are interned
+        find = self.terms.term_ids.get
+        columns = ((self.subj_ids, _get_subj), (self.pred_ids, _get_pred), (self.obj_ids, _get_obj))
+        t_list = iter(t_list)
+        while True:
+            batch = list(islice(t_list, 10000))
+            if not batch:
+                return
+            for ids, get_term in columns:
+                batch_terms = list(map(get_term, batch))
+                batch_ids = list(map(find, batch_terms))
+                if None in batch_ids:
+                    batch_ids = [intern(term) if term_id is None else term_id 
+                                 for term, term_id in zip(batch_terms, batch_ids)]
+                ids.extend(batch_ids)
+            
+    # Add rows of RDF terms (s, p, o), such as the rows of translate_parallel
+    # Blank nodes named by blank_node_name are turned back into Blank_Nodes,
+    # so the graph holds the same kinds of terms as a single process
+    # translation gives
+    def addRows(self, rows):
+        intern = self.terms.intern
+        blank_nodes = dict()    # key: text of a term, value: its blank node, or the text if it is not one
+        for subj, pred, obj in rows:
+            if subj.startswith("_:bNode"):
+                subj = blank_nodes.get(subj) or blank_nodes.setdefault(subj, _row_blank_node(subj))
+            if obj.startswith("_:bNode"):
+                obj = blank_nodes.get(obj) or blank_nodes.setdefault(obj, _row_blank_node(obj))
+            self.__append(intern(subj), intern(pred), intern(obj))
+            
+    # Get all entities (at any nesting depth) in order of first appearance
+    def entities(self):
+        terms = self.terms.terms
+        return [str(terms[ent]) for ent in self.entity_ids]
+    
+    # Get all relations (at any nesting depth) in order of first appearance
+    def relations(self):
+        terms = self.terms.terms
+        return [str(terms[rel]) for rel in self.relation_ids]
+    
+    # Get the number of statements each entity appears in
+    def entityFrequencies(self):
+        terms = self.terms.terms
+        return {str(terms[ent]): len(positions) for ent, positions in self.entity_index.items()}
+    
+    # Get the IDs of the given entities. Entities not in the graph are skipped
+    def entityIds(self, entities):
+        term_ids = self.terms.term_ids
+        entity_index = self.entity_index
+        ids = set()
+        other_ids = None    # key: entity as string, value: term ID
+        
+        for ent in entities:
+            term_id = term_ids.get(ent)
+            if term_id in entity_index:
+                ids.add(term_id)
+                continue
+            
+            # Entities that are not strings, such as blank nodes, are
+            # given by their string value
+            if other_ids is None:
+                terms = self.terms.terms
+                other_ids = {str(terms[i]): i for i in self.entity_ids if not isinstance(terms[i], str)}
+            if ent in other_ids:
+                ids.add(other_ids[ent])
+        
+        return ids
+    
+    # Get a graph of the statements at the given positions, in that order.
+    # It shares the term dictionary of this graph, so no terms or triples
+    # are copied, only the term IDs of the statements. Note that save_binary on it writes out the whole
+    # shared dictionary
+    def subgraph(self, positions):
+        graph = RDF_Star_Graph(self.terms)
+        graph.subj_ids = array('q', map(self.subj_ids.__getitem__, positions))
+        graph.pred_ids = array('q', map(self.pred_ids.__getitem__, positions))
+        graph.obj_ids = array('q', map(self.obj_ids.__getitem__, positions))
+        return graph
+    
+    # Get the positions of all statements containing any of the given entity
+    # IDs, at any depth, in graph order
+    def entityStatements(self, entity_ids):
+        positions = set()
+        for ent in entity_ids:
+            positions.update(self.entity_index.get(ent, ()))
+        return sorted(positions)
+    
+    # Build the permutation indexes used by match. They are built on the
+    # first match otherwise, and are then kept up to date on every add
+    def buildPatternIndex(self):
+        pattern_index = Pattern_Index()
+        terms = self.terms
+        for position, (subj_id, pred_id, obj_id) in enumerate(zip(self.subj_ids, self.pred_ids, self.obj_ids)):
+            pattern_index.add(terms, position, subj_id, pred_id, obj_id)
+        self.pattern_index = pattern_index
+        
+    # Get the positions of the statements matching a pattern, in graph order
+    # None is a wildcard, and a 3-tuple with wildcards inside it is a nested
+    # pattern for quoted triples, e.g. match(("s", "p", None), None, None)
+    # finds the statements about any quoted triple of s and p. Other terms,
+    # including quoted RDF* triples, must match exactly
+    def matchPositions(self, subj=None, pred=None, obj=None):
+        if self.pattern_index is None:
+            self.buildPatternIndex()
+        pattern_index = self.pattern_index
+        subj_ids = self.__patternIds(subj, pattern_index.quoted_subj_ids)
+        pred_ids = self.__patternIds(pred, ())
+        obj_ids = self.__patternIds(obj, pattern_index.quoted_obj_ids)
+        
+        obj_filter = None
+        if subj_ids is not None and (pred_ids is not None or obj_ids is None):
+            runs = pattern_index.runs(pattern_index.spo, subj_ids, pred_ids)
+            obj_filter = obj_ids
+        elif pred_ids is not None:
+            runs = pattern_index.runs(pattern_index.pos, pred_ids, obj_ids)
+        elif obj_ids is not None:
+            runs = pattern_index.runs(pattern_index.osp, obj_ids, subj_ids)
+        else:
+            return list(range(len(self)))
+        
+        if len(runs) == 1:
+            positions = list(runs[0])
+        else:
+            positions = sorted(chain.from_iterable(runs))
+        if obj_filter is not None:
+            obj_filter = set(obj_filter)
+            positions = [i for i in positions if self.obj_ids[i] in obj_filter]
+        return positions
+    
+    # Get the RDF* triples matching a pattern, in graph order. See
+    # matchPositions for the patterns
+    def match(self, subj=None, pred=None, obj=None):
+        return [self.getTriple(i) for i in self.matchPositions(subj, pred, obj)]
+    
+    # Get the candidate term IDs for one term of a pattern, or None for a
+    # wildcard. Nested patterns are checked against the quoted triple IDs
+    # used in that position
+    def __patternIds(self, term, quoted_ids):
+        if term is None:
+            return None
+        terms = self.terms
+        if _is_pattern(term):
+            return [term_id for term_id in quoted_ids if _matches_pattern(terms, term_id, term)]
+        if isinstance(term, tuple):
+            term = RDF_Star_Triple(term[0], term[1], term[2])
+        term_id = terms.find(term)
+        return () if term_id is None else (term_id,)
+    
+    # Get the number of statements each relation appears in
+    def relationFrequencies(self):
+        terms = self.terms.terms
+        return {str(terms[rel]): count for rel, count in self.relation_index.items()}
+    
+    # Check if knowledge graph contains only RDF (not RDF*) triples
+    def isRegularRDF(self):
+        terms = self.terms
+        for i in range(len(self.subj_ids)):
+            if terms.isQuoted(self.subj_ids[i]) or terms.isQuoted(self.obj_ids[i]):
+                return False
+        return True
+    
+    # This is a single function which can perform any translation algorithm
+    # given the name of the algorithm as a string input
+    # Setting processes above 1 (or to None for all cores) shards the graph
+    # across a process pool. The result is the same as a single process run,
+    # but for blank nodes being named after their quoted triple
+    # With dedup set, only the first copy of each output triple is kept
+    # With lazy set, a Translation_View is returned instead of a graph, and
+    # processes and dedup are not used
+    # Each call is a translation run of its own, see _translation_run
+    def performTranslationAlgo(self, algo, star_format="n-triples", processes=1, chunk_size=10000, dedup=False, 
+                               lazy=False):
+        if algo not in translation_algos:
+            return None
+        if lazy:
+            return Translation_View(self, algo, star_format)
+        
+        with _translation_run():
+            if processes == 1 and not dedup:
+                return self.__translate(algo, star_format)
+            
+            rdf = RDF_Star_Graph()
+            if processes == 1:
+                rdf.addAll(dedup_triples(translate_stream(self, algo, star_format)))
+            else:
+                rows = translate_parallel(self, algo, star_format, processes, chunk_size)
+                rdf.addRows(dedup_triples(rows) if dedup else rows)
+            return rdf
+    
+    # Translate the graph with several algorithms in a single pass over it
+    # Returns a dictionary from algorithm name to translated graph
+    def performTranslationAlgos(self, algos, star_format="n-triples"):
+        graphs = {algo: RDF_Star_Graph() for algo in algos}
+        translate_to_sinks(self, graphs, star_format)
+        return graphs
+    
+    # Build a new graph from the translation of every RDF* triple in this graph
+    def __translate(self, algo, star_format):
+        rdf = RDF_Star_Graph()
+        
+        with _phase("translate." + algo):
+            _translate_columns(self, algo, star_format, rdf)
                 
-                else:
-                    # Create blank node and add reference
-                    blank = Blank_Node()
-                    bn_dict[str(self.obj)] = blank
-
-                    # Spawn some new triples
-                    s_triple = RDF_Star_Triple(blank, s_tag, self.obj.subj)
-                    p_triple = RDF_Star_Triple(blank, p_tag, self.obj.pred)
-                    o_triple = RDF_Star_Triple(blank, o_tag, self.obj.obj)
-
-                    # Decompose, then add to list of triples
-                    triples.extend(s_triple.decompose())
-                    triples.append(p_triple)
-                    triples.extend(o_triple.decompose())
+        _count("translate." + algo + ".triples_emitted", len(rdf))
+        return rdf
+    
+    # Unqualiification algorithm
+    def simplify(self):
+        return self.__translate("unqualiification", None)
+    
+    # Convert from RDF* to RDF using standard reification
+    def decompose(self, star_format="n-triples"):
+        return self.__translate("std_reification", star_format)
+    
+    # Convert from RDF* to RDF using standard reification + unqualification
+    def convertToRegularRDF(self, star_format="n-triples"):
+        return self.__translate("std_reification_plus", star_format)
+    
+    # Convert from RDF* to RDF using symmetrical shortcut algorithm
+    def shortcutConvert(self):
+        return self.__translate("shortcut_symmetric", None)
+    
+    # Convert from RDF* to RDF using asymmetrical shortcut algorithm
+    def shortcutConvertV2(self):
+        return self.__translate("shortcut_asymmetric", None)
+    
+    # Convert from RDF* to RDF using extended reification (symmetrical version)
+    def enhancedConvertV1(self, star_format="n-triples"):
+        return self.__translate("ext_reification_symmetric", star_format)
+    
+    # Convert from RDF* to RDF using extended reification (asymmetrical version)
+    # Aka ExtRet
+    def enhancedConvertV2(self, star_format="n-triples"):
+        return self.__translate("extret", star_format)
+    
+    # Replace all old nodes containing certain values with new nodes
+    # Only subjects and objects are replaced, at any nesting depth
+    def replaceAll(self, old, new):
+        self.remap({old: new}, relations=False)
+        
+    # Replace many terms in a single pass over the graph. mapping maps old
+    # terms to new ones, which are replaced at any nesting depth inside
+    # quoted triples, and as relations too unless relations is False. All
+    # replacements are made at once, so they do not chain
+    def remap(self, mapping, relations=True):
+        terms = self.terms
+        num_terms = len(terms)
+        
+        # key: term ID, value: term ID it is replaced by
+        remap = dict()
+        for old, new in mapping.items():
+            old_id = terms.find(old)
+            if old_id is not None:
+                remap[old_id] = terms.intern(new)
+        if not remap:
+            return
+        replaced = set(remap)
+        
+        # Quoted triples always have larger IDs than the terms inside them,
+        # so one pass in ID order rewrites nested quoted triples bottom-up.
+        # The terms added for the new terms are left as they are
+        for term_id in range(num_terms):
+            term = terms.terms[term_id]
+            if not isinstance(term, tuple) or term_id in replaced:
+                continue
+            subj_id = remap.get(term[0], term[0])
+            pred_id = remap.get(term[1], term[1]) if relations else term[1]
+            obj_id  = remap.get(term[2], term[2])
+            if subj_id != term[0] or pred_id != term[1] or obj_id != term[2]:
+                remap[term_id] = terms.intern((subj_id, pred_id, obj_id))
+        
+        columns = (self.subj_ids, self.pred_ids, self.obj_ids) if relations else (self.subj_ids, self.obj_ids)
+        for ids in columns:
+            ids[:] = array('q', map(remap.get, ids, ids))
+                    
+        self.__clearIndexes()
+            
+    # Parse Tab-Separated-Values, or N-Triples-star / Turtle-star files with
+    # rdf_format set to "nt" or "ttl"
+    def parse(self, file_name, rdf_format="tsv"):
+        row_num = 0
+        with _phase("parse"):
+            for triple in _track(read_triples(file_name, rdf_format), "parse.statements"):
+                self.add(triple)
+                row_num += 1
+            
+        _log("Number of RDF* triples parsed: ", row_num)
+    
+    # Write the graph as tsv, csv or N-Triples-star ("nt"), optionally
+    # compressed. See Triple_Writer
+    def serialise(self, file_name, rdf_format="tsv", compression=None, level=None, threads=1):
+        with _phase("serialise"), Triple_Writer(file_name, rdf_format, compression, level, threads) as writer:
+            _count("serialise.triples", writer.writeGraph(self))
+        _log("Number of RDF triples serialised: ", writer.row_num)
+    
+    def convertToNTXStyle(self, triple):
+        return triple_to_ntx(triple)
+        
+    def __str__(self):
+        return str([str(elem) for elem in self])
+    
+    def __iter__(self):
+        return RDF_Star_Iterator(self)
+    
+    def __len__(self):
+        return len(self.subj_ids)
+    
+    # Save the term dictionary and ID columns in a binary file that
+    # load_binary can map into memory. An existing file is removed rather
+    # than overwritten, so graphs mapped from it, this one included, keep
+    # reading the old contents
+    def save_binary(self, file_name):
+        terms = self.terms.terms
+        offsets = array('q', [0])
+        
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+        with open(file_name, 'wb') as file:
+            file.write(_binary_magic)
+            file.write(_binary_header.pack(len(self), len(terms), 0))
+            for ids in (self.subj_ids, self.pred_ids, self.obj_ids):
+                _write_ids(file, ids)
                 
-                new_triple.setObject(blank)
+            encoded_size = 0
+            for term_id, term in enumerate(terms):
+                encoded = _encode_term(term, term_id)
+                file.write(encoded)
+                encoded_size += len(encoded)
+                offsets.append(encoded_size)
                 
+            # Pad to keep the offsets 8-byte aligned
+            file.write(b'\0' * (-encoded_size % 8))
+            _write_ids(file, offsets)
+            
+            file.seek(len(_binary_magic))
+            file.write(_binary_header.pack(len(self), len(terms), encoded_size))
+            
+    # Load a graph saved with save_binary. The ID columns and terms are
+    # mapped from the file without copying, and pages are read as they are
+    # used. Mapped pages are copy-on-write, so the file is never changed
+    @staticmethod
+    def load_binary(file_name):
+        with open(file_name, 'rb') as file:
+            mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+            
+        if mapping[:len(_binary_magic)] != _binary_magic:
+            raise ValueError("Not a binary RDF* graph file: " + str(file_name))
+        num_triples, num_terms, encoded_size = _binary_header.unpack_from(mapping, len(_binary_magic))
+        
+        view = memoryview(mapping)
+        pos = len(_binary_magic) + _binary_header.size
+        columns = []
+        for _ in range(3):
+            columns.append(_mapped_ids(view[pos:pos + 8 * num_triples]))
+            pos += 8 * num_triples
+        encoded = view[pos:pos + encoded_size]
+        pos += encoded_size + (-encoded_size % 8)
+        offsets = _mapped_ids(view[pos:pos + 8 * (num_terms + 1)])
+        
+        graph = RDF_Star_Graph(Mapped_Term_Dictionary(Mapped_Terms(offsets, encoded)))
+        graph.subj_ids, graph.pred_ids, graph.obj_ids = columns
+        return graph
+    
+    # Copy mapped ID columns into arrays so triples can be added
+    def __unmap(self):
+        for name in ("subj_ids", "pred_ids", "obj_ids"):
+            ids = array('q')
+            ids.frombytes(getattr(self, name).cast('B'))
+            setattr(self, name, ids)
+    
+class RDF_Star_Iterator(): # This class will allow the graph object to be iterable
+    
+    def __init__(self, rdf_star):
+        self.rdf_star = rdf_star
+        self.triples = rdf_star.iterTriples()
+        
+    def __iter__(self):
+        return self
+        
+    def __next__(self):
+        return next(self.triples)
+        
+# Translate the statements of a graph with the named translation algorithm
+# straight from its term ID columns, appending the output to the columns of
+# the graph rdf. The output is the same as translating each statement with
+# translation_algos. RDF triples, statements up to _max_recursion_level
+# levels deep for unqualification and standard reification, and statements
+# quoting a single RDF triple for the shortcut algorithms, are translated on
+# term IDs without building any RDF* triples. Each term and path relation
+# is only interned in rdf once. Other statements are rebuilt and translated
+# as RDF* triples
+def _translate_columns(graph, algo, star_format, rdf):
+    terms = graph.terms.terms
+    lookup = graph.terms.lookup
+    out_intern = rdf.terms.intern
+    find = rdf.terms.term_ids.get
+    out_ids = dict()        # key: term ID in graph, value: term ID in rdf
+    paths = dict()          # key: (relation ID, relation ID, inverse, quoted in subject), value: path relation ID
+    unqualified = dict()    # key: quoted triple ID, value: its unqualification as rdf ID tuples
+    tag_ids = dict()        # key: reification tag, value: its term ID in rdf, interned when first emitted
+    star_tags = _reification_tags(star_format)
+    uri_tags = (s_URI, p_URI, o_URI)
+    bases = composite_algos.get(algo, (algo,))
+    subj_out, pred_out, obj_out = rdf.subj_ids, rdf.pred_ids, rdf.obj_ids
+    
+    def out(term_id):
+        out_id = out_ids.get(term_id)
+        if out_id is None:
+            out_id = out_ids[term_id] = out_intern(lookup(term_id))
+        return out_id
+    
+    def emit(subj_id, pred_id, obj_id):
+        subj_out.append(subj_id)
+        pred_out.append(pred_id)
+        obj_out.append(obj_id)
+        
+    # Unqualification of a quoted triple, as for getDeepestTriples
+    def unqualify(term_id):
+        triples = unqualified.get(term_id)
+        if triples is None:
+            term = terms[term_id]
+            quoted = [part for part in (term[0], term[2]) if isinstance(terms[part], tuple)]
+            if quoted:
+                triples = tuple(chain.from_iterable(map(unqualify, quoted)))
+            else:
+                triples = ((out(term[0]), out(term[1]), out(term[2])),)
+            unqualified[term_id] = triples
+        return triples
+    
+    def tag_id(tag):
+        out_id = tag_ids.get(tag)
+        if out_id is None:
+            out_id = tag_ids[tag] = out_intern(tag)
+        return out_id
+    
+    # Get the rdf ID standing for a term in standard reification: the term
+    # itself, or the blank node of a quoted triple. The reification triples
+    # of a blank node minted for it are emitted first, as for _reify
+    def reify(term_id, tags):
+        term = terms[term_id]
+        if not isinstance(term, tuple):
+            return out(term_id)
+        blank, minted = _blank_node(lookup(term_id))
+        blank_id = out_intern(blank)
+        if minted:
+            for tag, part in zip(tags, term):
+                emit(blank_id, tag_id(tag), reify(part, uri_tags))
+        return blank_id
+    
+    # ID of the relation linking a quoted triple with relation quoted_pred
+    # to the other end of a statement with relation pred
+    def path(quoted_pred, pred, inverse, in_subject):
+        key = (quoted_pred, pred, inverse, in_subject)
+        path_id = paths.get(key)
+        if path_id is None:
+            if in_subject:
+                path_id = out_intern(lookup(quoted_pred) + inverse + "/" + lookup(pred))
             else:
-                new_triple.setObject(self.obj)
+                path_id = out_intern(lookup(pred) + "/" + lookup(quoted_pred) + inverse)
+            paths[key] = path_id
+        return path_id
+    
+    columns = zip(graph.subj_ids, graph.pred_ids, graph.obj_ids)
+    for subj_id, pred_id, obj_id in _track(columns, "translate." + algo + ".statements"):
+        subj, obj = terms[subj_id], terms[obj_id]
+        subj_quoted, obj_quoted = isinstance(subj, tuple), isinstance(obj, tuple)
+        if not (subj_quoted or obj_quoted):
+            # Every algorithm leaves RDF triples as they are
+            emit(out_ids.get(subj_id) or out(subj_id), out_ids.get(pred_id) or out(pred_id), 
+                 out_ids.get(obj_id) or out(obj_id))
+            continue
+        
+        # Nesting level of the statement, which is 1 unless a quoted triple
+        # quotes another one
+        level = 1
+        if subj_quoted and (isinstance(terms[subj[0]], tuple) or isinstance(terms[subj[2]], tuple)):
+            level = lookup(subj_id)._level + 1
+        if obj_quoted and (isinstance(terms[obj[0]], tuple) or isinstance(terms[obj[2]], tuple)):
+            level = max(level, lookup(obj_id)._level + 1)
+            
+        for base in bases:
+            if base == "unqualiification" and level == 1:
+                if subj_quoted:
+                    emit(out(subj[0]), out(subj[1]), out(subj[2]))
+                if obj_quoted:
+                    emit(out(obj[0]), out(obj[1]), out(obj[2]))
+                    
+            elif base == "unqualiification" and level <= _max_recursion_level:
+                for term_id, quoted in ((subj_id, subj_quoted), (obj_id, obj_quoted)):
+                    if quoted:
+                        for triple in unqualify(term_id):
+                            emit(*triple)
+                        
+            elif base == "std_reification" and level <= _max_recursion_level:
+                new_subj_id = reify(subj_id, star_tags)
+                new_obj_id = reify(obj_id, star_tags)
+                emit(new_subj_id, out(pred_id), new_obj_id)
                 
-            triples.append(new_triple)
+            elif (base in ("shortcut_symmetric", "shortcut_asymmetric") and level == 1
+                  and not (subj_quoted and obj_quoted)):
+                inverse = "^-1" if base == "shortcut_asymmetric" else ""
+                if subj_quoted:
+                    quoted_subj, quoted_pred, quoted_obj = subj
+                    emit(out(quoted_subj), out(quoted_pred), out(quoted_obj))
+                    emit(out(quoted_subj), path(quoted_pred, pred_id, "", True), out(obj_id))
+                    emit(out(quoted_obj), path(quoted_pred, pred_id, inverse, True), out(obj_id))
+                else:
+                    quoted_subj, quoted_pred, quoted_obj = obj
+                    emit(out(quoted_subj), out(quoted_pred), out(quoted_obj))
+                    emit(out(subj_id), path(quoted_pred, pred_id, "", False), out(quoted_subj))
+                    emit(out(subj_id), path(quoted_pred, pred_id, inverse, False), out(quoted_obj))
+                    
+            else:
+                star_triple = _live_triple(lookup(subj_id), lookup(pred_id), lookup(obj_id))
+                for triple in translation_algos[base](star_triple, star_format):
+                    subj_out.append(find(triple.subj) or out_intern(triple.subj))
+                    pred_out.append(find(triple.pred) or out_intern(triple.pred))
+                    obj_out.append(find(triple.obj) or out_intern(triple.obj))
+        
+# Write 64-bit IDs to a binary file in little-endian order
+def _write_ids(file, ids):
+    if sys.byteorder == 'big':
+        ids = array('q', ids)
+        ids.byteswap()
+    file.write(ids)
+
+load_binary = RDF_Star_Graph.load_binary
+
+# Parse each row in tsv file in a single pass. Nested triples are
+# collected on an explicit stack instead of by recursion
+def _parse_row(row):
+    stack = []
+    storage = []
+    
+    for token in row:
+        if token == "<<":
+            # Start of nested triple
+            stack.append(storage)
+            storage = []
+        elif token == ">>":
+            # End of nested triple
+            nested = (storage[0], storage[1], storage[2])
+            storage = stack.pop()
+            storage.append(nested)
+        else:
+            storage.append(token)
+
+    # Triples must have three elements, followed by "."
+    return (storage[0], storage[1], storage[2])
+
+# Rebuild an RDF* triple from a tsv row
+def _row_to_triple(row):
+    return RDF_Star_Triple(*_parse_row(row))
+
+# Convert an RDF* triple to a tsv row
+def triple_to_ntx(triple):
+    if triple._level > 1:
+        ntx_list = _leaves(_triple_terms(triple), _ntx_tokens)
+    else:
+        ntx_list = []
+        for term in _triple_terms(triple):
+            if isinstance(term, RDF_Star_Triple):
+                ntx_list.extend(("<<", term.subj, term.pred, term.obj, ">>"))
+            else:
+                ntx_list.append(term)
+    ntx_list.append(".")
+    return ntx_list
+
+# Nested triples are written between "<<" and ">>"
+def _ntx_tokens(term):
+    if isinstance(term, RDF_Star_Triple):
+        return ("<<", term.subj, term.pred, term.obj, ">>")
+    return ()
+
+# Read RDF* triples from a tsv file one row at a time. The file can be
+# gzip, bz2 or xz compressed
+# Triples are generated in tuple format
+def read_tsv(file_name):
+    for row in _read_tsv_rows(file_name):
+        yield _parse_row(row)
+
+# Read the rows of tokens of a tsv file, without parsing them
+def _read_tsv_rows(file_name):
+    with _open_input(file_name) as file:
+        yield from csv.reader(file, delimiter="\t")
+
+# Read RDF* triples from an N-Triples-star or Turtle-star file
+# Triples are generated in tuple format, with terms in N-Triples form
+def read_turtle(file_name):
+    with _open_input(file_name) as file:
+        yield from Turtle_Star_Reader(_tokenise(file)).triples()
+        
+# Read RDF* triples from a file in the given format
+def read_triples(file_name, rdf_format="tsv"):
+    if rdf_format == "tsv":
+        return read_tsv(file_name)
+    elif rdf_format in ("nt", "n-triples", "ttl", "turtle"):
+        return read_turtle(file_name)
+    raise ValueError("Unknown RDF* format: " + str(rdf_format))
+
+rdf_type = "<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"
+xsd_URI = "http://www.w3.org/2001/XMLSchema#"
+
+# Tokens of N-Triples-star and Turtle-star, each with any whitespace and
+# comments in front of it. A comment can only end at the end of its line, so
+# backtracking never gives part of it back to the token alternatives, which
+# are tried in order. Whitespace is taken one character at a time, so a
+# failed match backtracks in linear time
+_token_re = re.compile(r'''
+    (?:\s|\#[^\n]*(?![^\n]))*
+    (?:
+      (?P<iri><[^<>"{}|^`\\\x00-\x20]*>)
+    | (?P<open><<)
+    | (?P<close>>>)
+    | (?P<punct>[.;,])
+    | (?P<bnode>_:[^\W](?:[\w.\-]*[\w\-])?)
+    | (?P<long>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^\'\\]|\\.|\'(?!\'\'))*\'\'\')
+    | (?P<string>"(?:[^"\\\n\r]|\\.)*"|\'(?:[^\'\\\n\r]|\\.)*\')
+    | (?P<lang>@[a-zA-Z]+(?:-[a-zA-Z0-9]+)*)
+    | (?P<datatype>\^\^)
+    | (?P<number>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.?\d+[eE][+-]?\d+|\d*\.\d+|\d+))
+    | (?P<pname>(?:[^\W\d_][\w.\-]*)?:(?:[\w:%\-]|\\.|\.(?=[\w:%\-]))*)
+    | (?P<keyword>[A-Za-z]+)
+    )
+''', re.VERBOSE)
+_space_re = re.compile(r'(?:\s+|\#[^\n]*)*')
+
+# Tokens that end this close to the end of the buffer may continue in the
+# next block, so more of the file is read before they are accepted
+_token_lookahead = 256
+
+# Split N-Triples-star / Turtle-star text into (kind, text) tokens in a single
+# pass, reading the file in blocks
+def _tokenise(file, block_size=1 << 20):
+    buffer = ""
+    pos = 0
+    eof = False
+    
+    while True:
+        block = file.read(block_size)
+        if block:
+            buffer = buffer[pos:] + block
+            pos = 0
+        else:
+            eof = True
+        limit = len(buffer) if eof else len(buffer) - _token_lookahead
+        
+        for match in iter(_token_re.scanner(buffer, pos).match, None):
+            kind = match.lastgroup
+            if match.end() > limit:
+                break
+            if kind == "string":
+                # A short string at the start of a long string means the long
+                # string has not been read in full yet
+                start = match.start(kind)
+                if buffer.startswith(buffer[start] * 3, start):
+                    if eof:
+                        raise ValueError("Unterminated long string near: " + buffer[start:start + 40])
+                    break
+            pos = match.end()
+            yield kind, match.group(kind)
             
-        return triples
+        if eof:
+            if _space_re.match(buffer, pos).end() != len(buffer):
+                raise ValueError("Invalid RDF* syntax near: " + buffer[pos:pos + 40].strip())
+            return
         
-    # Decompose an RDF* triple based on symmetrical shortcut algorithm
-    def shortDecompose(self):
-        triples = list()
+# Parser for N-Triples-star and Turtle-star. Supports prefixes, base IRIs,
+# predicate and object lists, quoted triples and literal shorthands. Blank
+# node property lists, collections and annotations are not supported
+class Turtle_Star_Reader():
+    
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.lookahead = None
+        self.prefixes = dict()  # key: prefix, value: namespace IRI without brackets
+        self.base = None
         
-        if self.isRDFTriple():
-            # So the given triple is an RDF triple itself
-            triples.append(RDF_Star_Triple(self.subj, self.pred, self.obj))
+    # Get the next token without consuming it
+    def peek(self):
+        if self.lookahead is None:
+            self.lookahead = next(self.tokens, (None, None))
+        return self.lookahead
+    
+    # Consume the next token
+    def next(self):
+        token = self.lookahead
+        if token is None:
+            return next(self.tokens, (None, None))
+        self.lookahead = None
+        return token
+    
+    def expect(self, text):
+        _, value = self.next()
+        if value != text:
+            raise ValueError("Expected " + text + " but found " + str(value))
+        
+    # Generate all triples in the file in tuple format
+    def triples(self):
+        while True:
+            kind, value = self.peek()
+            if kind is None:
+                return
+            if self.__directive(kind, value):
+                continue
             
-        elif (isinstance(self.subj, RDF_Star_Triple)):
-            # So the subject is an RDF* triple
+            subj = self.term()
             
-            # Spawn some new triples
-            nested_triple = RDF_Star_Triple(self.subj.subj, self.subj.pred, self.subj.obj)
-            external_triple_s = RDF_Star_Triple(self.subj.subj, self.subj.pred + "/" + self.pred, self.obj)
-            external_triple_o = RDF_Star_Triple(self.subj.obj, self.subj.pred + "/" + self.pred, self.obj)
-
-            # Decompose, then add to list of triples
-            triples.extend(nested_triple.shortDecompose())
-            triples.extend(external_triple_s.shortDecompose())
-            triples.extend(external_triple_o.shortDecompose())
+            # Predicate-object list, ended by "."
+            while True:
+                pred = self.term()
                 
-        elif (isinstance(self.obj, RDF_Star_Triple)):
-            # So the object is an RDF* triple
-            
-            # Spawn some new triples
-            nested_triple = RDF_Star_Triple(self.obj.subj, self.obj.pred, self.obj.obj)
-            external_triple_s = RDF_Star_Triple(self.subj, self.pred + "/" + self.obj.pred, self.obj.subj)
-            external_triple_o = RDF_Star_Triple(self.subj, self.pred + "/" + self.obj.pred, self.obj.obj)
-
-            # Decompose, then add to list of triples
-            triples.extend(nested_triple.shortDecompose())
-            triples.extend(external_triple_s.shortDecompose())
-            triples.extend(external_triple_o.shortDecompose())
+                # Object list
+                while True:
+                    yield (subj, pred, self.term())
+                    if self.peek()[1] != ",":
+                        break
+                    self.next()
                 
-        return triples
+                _, value = self.next()
+                if value == ";":
+                    while self.peek()[1] == ";":
+                        self.next()
+                    if self.peek()[1] != ".":
+                        continue
+                    self.next()
+                    break
+                elif value == ".":
+                    break
+                raise ValueError("Expected ; or . but found " + str(value))
+                
+    # Read a subject, predicate or object. Quoted triples are collected on an
+    # explicit stack and returned as nested tuples
+    def term(self):
+        kind, value = self.next()
+        if kind == "iri" and self.base is None:
+            return value
         
-    # Decompose an RDF* triple based on asymmetrical shortcut algorithm
-    def shortDecomposeV2(self):
-        triples = list()
+        stack = []
+        while True:
+            if kind == "open":
+                stack.append([])
+                kind, value = self.next()
+                continue
+            
+            term = self.__simple_term(kind, value)
+            while stack:
+                stack[-1].append(term)
+                if len(stack[-1]) < 3:
+                    break
+                self.expect(">>")
+                quoted = stack.pop()
+                term = (quoted[0], quoted[1], quoted[2])
+            else:
+                return term
+            
+            kind, value = self.next()
+            
+    # Handle @prefix, @base, PREFIX and BASE. Returns False for anything else
+    def __directive(self, kind, value):
+        if kind == "lang" and value in ("@prefix", "@base"):
+            sparql_style = False
+        elif kind == "keyword" and value.upper() in ("PREFIX", "BASE"):
+            sparql_style = True
+        else:
+            return False
+        
+        self.next()
+        if value.lower().endswith("prefix"):
+            kind, prefix = self.next()
+            if kind != "pname" or not prefix.endswith(":"):
+                raise ValueError("Invalid prefix: " + str(prefix))
+            self.prefixes[prefix[:-1]] = self.__simple_term(*self.next())[1:-1]
+        else:
+            self.base = self.__simple_term(*self.next())[1:-1]
+            
+        if not sparql_style:
+            self.expect(".")
+        return True
+    
+    def __simple_term(self, kind, value):
+        if kind == "iri":
+            if self.base is not None:
+                return "<" + urljoin(self.base, value[1:-1]) + ">"
+            return value
+        elif kind == "bnode":
+            return value
+        elif kind == "pname":
+            prefix, local = value.split(":", 1)
+            if prefix not in self.prefixes:
+                raise ValueError("Unknown prefix: " + prefix)
+            return "<" + self.prefixes[prefix] + re.sub(r"\\(.)", r"\1", local) + ">"
+        elif kind == "string" or kind == "long":
+            return self.__literal(kind, value)
+        elif kind == "number":
+            if "e" in value or "E" in value:
+                return '"' + value + '"^^<' + xsd_URI + 'double>'
+            elif "." in value:
+                return '"' + value + '"^^<' + xsd_URI + 'decimal>'
+            return '"' + value + '"^^<' + xsd_URI + 'integer>'
+        elif kind == "keyword":
+            if value == "a":
+                return rdf_type
+            elif value in ("true", "false"):
+                return '"' + value + '"^^<' + xsd_URI + 'boolean>'
+        raise ValueError("Unexpected token: " + str(value))
+    
+    # Convert a string and any language tag or datatype to N-Triples form
+    def __literal(self, kind, value):
+        if kind == "long":
+            body = value[3:-3].replace("\r", "\\r").replace("\n", "\\n")
+            lexical = '"' + re.sub(r'(?<!\\)((?:\\\\)*)"', r'\1\\"', body) + '"'
+        elif value[0] == "'":
+            lexical = '"' + re.sub(r'(?<!\\)((?:\\\\)*)"', r'\1\\"', value[1:-1]) + '"'
+        else:
+            lexical = value
+            
+        kind, suffix = self.peek()
+        if kind == "lang":
+            self.next()
+            return lexical + suffix
+        elif kind == "datatype":
+            self.next()
+            return lexical + "^^" + self.__simple_term(*self.next())
+        return lexical
+
+# Compressed files are recognised by their first bytes when read, and by
+# their suffix when written. key: compression, value: module, keyword of
+# its compression level and default level
+_compressors = {
+    "gzip": (gzip, "compresslevel", 6),
+    "bz2":  (bz2, "compresslevel", 9),
+    "xz":   (lzma, "preset", 6),
+}
+_compression_suffixes = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz"}
+
+# Get the compression of a file from its first bytes, or None
+def _sniff_compression(start):
+    if start.startswith(b"\x1f\x8b"):
+        return "gzip"
+    elif start.startswith(b"\xfd7zXZ\x00"):
+        return "xz"
+    # "BZh" could also start a text file, so the block size digit and the
+    # magic number of the first block (or of the end of an empty stream)
+    # are checked as well
+    elif start[:3] == b"BZh" and start[3:4].isdigit() and start[4:10] in (b"1AY&SY", b"\x17rE8P\x90"):
+        return "bz2"
+    return None
+
+# Open a file for reading as text, decompressing it if it is a gzip, bz2
+# or xz file
+def _open_input(file_name):
+    with open(file_name, 'rb') as file:
+        compression = _sniff_compression(file.read(10))
+    if compression is None:
+        return open(file_name, encoding='utf-8')
+    return _compressors[compression][0].open(file_name, 'rt', encoding='utf-8')
+
+# Open a file for writing bytes. compression is "gzip", "bz2", "xz" or
+# "none", and is taken from the suffix of the file name when not given.
+# level is the compression level, and with threads > 1 blocks of the
+# output are compressed in parallel
+def _open_output(file_name, compression=None, level=None, threads=1):
+    if compression is None:
+        compression = "none"
+        for suffix, name in _compression_suffixes.items():
+            if str(file_name).endswith(suffix):
+                compression = name
+    if compression == "none":
+        return open(file_name, 'wb')
+    if compression not in _compressors:
+        raise ValueError("Unknown compression: " + str(compression))
+    
+    module, level_keyword, default_level = _compressors[compression]
+    options = {level_keyword: default_level if level is None else level}
+    if threads > 1:
+        return Block_Compressor(open(file_name, 'wb'), partial(module.compress, **options), threads)
+    return module.open(file_name, 'wb', **options)
+
+# File object that compresses blocks of output on a pool of threads, which
+# gzip, bz2 and lzma all allow by releasing the GIL. Each block becomes a
+# separate gzip member or bz2/xz stream, and the standard tools and modules
+# read the concatenated streams back as one file
+class Block_Compressor():
+    
+    def __init__(self, file, compress, threads, block_size=1 << 22):
+        self.file = file
+        self.compress = compress
+        self.pool = ThreadPoolExecutor(threads)
+        self.pending = deque()      # Compressed blocks, in output order
+        self.max_pending = 2 * threads
+        self.block_size = block_size
+        self.block = []
+        self.buffered = 0
         
-        if self.isRDFTriple():
-            # So the given triple is an RDF triple itself
-            triples.append(RDF_Star_Triple(self.subj, self.pred, self.obj))
+    def write(self, data):
+        self.block.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.block_size:
+            self.__submit()
+        return len(data)
+    
+    def __submit(self):
+        if self.block:
+            self.pending.append(self.pool.submit(self.compress, b"".join(self.block)))
+            self.block = []
+            self.buffered = 0
+        while len(self.pending) > self.max_pending:
+            self.file.write(self.pending.popleft().result())
             
-        elif (isinstance(self.subj, RDF_Star_Triple)):
-            # So the subject is an RDF* triple
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            self.__submit()
+            while self.pending:
+                self.file.write(self.pending.popleft().result())
+        finally:
+            self.pool.shutdown()
+            self.file.close()
             
-            # Spawn some new triples
-            nested_triple = RDF_Star_Triple(self.subj.subj, self.subj.pred, self.subj.obj)
-            external_triple_s = RDF_Star_Triple(self.subj.subj, self.subj.pred + "/" + self.pred, self.obj)
-            external_triple_o = RDF_Star_Triple(self.subj.obj, self.subj.pred + "^-1" + "/" + self.pred, self.obj)
+    @property
+    def closed(self):
+        return self.file.closed
 
-            # Decompose, then add to list of triples
-            triples.extend(nested_triple.shortDecomposeV2())
-            triples.extend(external_triple_s.shortDecomposeV2())
-            triples.extend(external_triple_o.shortDecomposeV2())
-                
-        elif (isinstance(self.obj, RDF_Star_Triple)):
-            # So the object is an RDF* triple
-            
-            # Spawn some new triples
-            nested_triple = RDF_Star_Triple(self.obj.subj, self.obj.pred, self.obj.obj)
-            external_triple_s = RDF_Star_Triple(self.subj, self.pred + "/" + self.obj.pred, self.obj.subj)
-            external_triple_o = RDF_Star_Triple(self.subj, self.pred + "/" + self.obj.pred + "^-1", self.obj.obj)
-
-            # Decompose, then add to list of triples
-            triples.extend(nested_triple.shortDecomposeV2())
-            triples.extend(external_triple_s.shortDecomposeV2())
-            triples.extend(external_triple_o.shortDecomposeV2())
-                
-        return triples
-        
-    def convertToTuple(self):    
-        # Level 0
-        if not isinstance(self.subj, RDF_Star_Triple) and not isinstance(self.obj, RDF_Star_Triple):
-            return (self.subj, self.pred, self.obj)
-        # Object is a triple
-        elif not isinstance(self.subj, RDF_Star_Triple):
-            return (self.subj, self.pred, self.obj.convertToTuple())
-        # Subject is a triple
-        elif not isinstance(self.obj, RDF_Star_Triple):
-            return (self.subj.convertToTuple(), self.pred, self.obj)
-        # Both subject and object are triples
-        else:
-            return (self.subj.convertToTuple(), self.pred, self.obj.convertToTuple())
+# Quote a field the way csv.writer does with the given delimiter
+def _quote_field(field, delimiter):
+    if delimiter in field or '"' in field or "\r" in field or "\n" in field:
+        return '"' + field.replace('"', '""') + '"'
+    return field
+
+# Encoded bytes of each term, as written by Triple_Writer. A quoted triple
+# is encoded as its whole token sequence, between the brackets if there
+# are any, so each one is only rendered once. Cleared when it holds
+# max_size terms
+class _Term_Fields(dict):
+    
+    def __init__(self, separator, quote, brackets=(b"<<", b">>"), max_size=1000000):
+        self.separator = separator
+        self.quote = quote
+        self.brackets = brackets
+        self.max_size = max_size
         
-    def __eq__(self, other):
-        if not isinstance(other, RDF_Star_Triple):
-            return False
-        return self.subj == other.subj and self.pred == other.pred and self.obj == other.obj
+    def quoted(self, subj, pred, obj):
+        if self.brackets is None:
+            return self.separator.join((subj, pred, obj))
+        return self.separator.join((self.brackets[0], subj, pred, obj, self.brackets[1]))
         
-    def __str__(self):
-        return "(" + str(self.subj) + ", " + str(self.pred) + ", " + str(self.obj) + ")"
-    
-# Intermediate node object
-class Blank_Node():
-    
-    def __init__(self, name=None):
-        self.name = name
+    def __missing__(self, term):
+        if len(self) >= self.max_size:
+            self.clear()
+        if not isinstance(term, RDF_Star_Triple):
+            field = self.quote(term if isinstance(term, str) else str(term)).encode('utf-8')
+            self[term] = field
+            return field
         
-    def __str__(self):
-        return "_:" + "bNode" + str(id(self)) # self.name
+        # Quoted triples are encoded after the ones inside them
+        for quoted in reversed(_visit((term,), _quoted_triples)):
+            if quoted not in self:
+                self[quoted] = self.quoted(self[quoted.subj], self[quoted.pred], self[quoted.obj])
+        return self[term]
     
-class RDF_Star_Graph():
+# Encoded bytes of each term ID of a term dictionary, with quoted triple
+# IDs encoded like _Term_Fields encodes quoted triples
+class _Term_ID_Fields(dict):
     
-    def __init__(self):
-        self.triples_list = []
+    def __init__(self, terms, fields):
+        self.terms = terms
+        self.fields = fields
         
-    # Add an RDF* triple to the knowledge graph
-    def add(self, triple, copy=True):
-        if isinstance(triple, tuple):
-            # Triple is a tuple, Tuple should have three elements
-            self.triples_list.append(RDF_Star_Triple(triple[0], triple[1], triple[2]))
-            
-        elif isinstance(triple, RDF_Star_Triple):
-            if (copy):
-                self.triples_list.append(RDF_Star_Triple(triple.subj, triple.pred, triple.obj))
+    def __missing__(self, term_id):
+        terms = self.terms
+        stack = [term_id]
+        while stack:
+            top = stack[-1]
+            term = terms[top]
+            if not isinstance(term, tuple):
+                self[top] = self.fields[term]
+                stack.pop()
+                continue
+            missing = [part for part in term if part not in self]
+            if missing:
+                stack.extend(missing)
             else:
-                self.triples_list.append(triple)
+                self[top] = self.fields.quoted(self[term[0]], self[term[1]], self[term[2]])
+                stack.pop()
+        return self[term_id]
 
-    # Add list of triples to the knowledge graph          
-    # For RDF* triples only, NO TUPLES, NO COPY YET
-    def addAll(self, t_list):
-        self.triples_list.extend(t_list)
+# Term encoding and row ending of each rdf_format of Triple_Writer
+def _row_format(rdf_format):
+    if rdf_format == "tsv":
+        return _Term_Fields(b"\t", partial(_quote_field, delimiter="\t")), b"\t.\r\n"
+    elif rdf_format == "csv":
+        return _Term_Fields(b",", partial(_quote_field, delimiter=","), None), b"\r\n"
+    elif rdf_format in ("nt", "n-triples"):
+        return _Term_Fields(b" ", str), b" .\n"
+    raise ValueError("Unknown RDF* format: " + str(rdf_format))
+
+# Writes RDF* triples to a file in large blocks of encoded bytes, encoding
+# each term only once. rdf_format is
+#   "tsv": the rows of triple_to_ntx, as csv.writer writes them with a tab
+#          delimiter
+#   "csv": the rows of serialise_csv, as csv.writer writes them. Quoted
+#          triples are flattened into their terms
+#   "nt":  N-Triples-star, with terms written as they are, so they should
+#          already be in N-Triples form
+# See _open_output for compression, level and threads. Also works as a sink
+# for translate_to_sinks
+class Triple_Writer():
     
-    # Check if knowledge graph contains only RDF (not RDF*) triples
-    def isRegularRDF(self):
-        for triple in self.triples_list:
-            if triple.level() != 0:
-                return False
-        return True
+    def __init__(self, file_name, rdf_format="tsv", compression=None, level=None, threads=1, buffer_rows=10000):
+        self.fields, self.end = _row_format(rdf_format)
+        self.file = _open_output(file_name, compression, level, threads)
+        self.buffer_rows = buffer_rows
+        self.rows = []
+        self.row_num = 0
+        
+    def write(self, triple):
+        self.writeAll((triple,))
+        
+    def writeAll(self, triples):
+        fields = self.fields
+        separator = fields.separator
+        end = self.end
+        rows = self.rows
+        buffer_rows = self.buffer_rows
+        row_num = 0
+        
+        for triple in triples:
+            rows.append(fields[triple.subj] + separator + fields[triple.pred] + separator + fields[triple.obj] + end)
+            row_num += 1
+            if len(rows) >= buffer_rows:
+                self.flush()
+                
+        self.row_num += row_num
+        return row_num
     
-    # This is a single function which can perform any translation algorithm
-    # given the name of the algorithm as a string input
-    def performTranslationAlgo(self, algo, star_format="n-triples"):
-        if algo == "unqualiification":
-            return self.simplify()
-        elif algo == "std_reification":
-            return self.decompose(star_format=star_format)
-        elif algo == "std_reification_plus":
-            return self.convertToRegularRDF(star_format=star_format)
-        elif algo == "shortcut_symmetric":
-            return self.shortcutConvert()
-        elif algo == "shortcut_asymmetric":
-            return self.shortcutConvertV2()
-        elif algo == "ext_reification_symmetric":
-            return self.enhancedConvertV1(star_format=star_format)
-        elif (algo == "ext_reification") or (algo == "extret"):
-            return self.enhancedConvertV2(star_format=star_format)
-        else:
-            return None
+    # Write the statements of a graph straight from its term IDs
+    def writeGraph(self, graph):
+        fields = _Term_ID_Fields(graph.terms.terms, self.fields)
+        separator = self.fields.separator
+        end = self.end
+        rows = self.rows
+        buffer_rows = self.buffer_rows
+        
+        for subj_id, pred_id, obj_id in zip(graph.subj_ids, graph.pred_ids, graph.obj_ids):
+            rows.append(fields[subj_id] + separator + fields[pred_id] + separator + fields[obj_id] + end)
+            if len(rows) >= buffer_rows:
+                self.flush()
+                
+        self.row_num += len(graph)
+        return len(graph)
+        
+    # Write rows of any number of terms, e.g. the rows of serialise_csv for
+    # hyper-relational statements. With terms set to a term dictionary,
+    # the rows hold term IDs
+    def writeRows(self, rows, terms=None):
+        fields = self.fields if terms is None else _Term_ID_Fields(terms.terms, self.fields)
+        separator = self.fields.separator
+        end = self.end
+        buffer_rows = self.buffer_rows
+        row_num = 0
+        
+        for row in rows:
+            self.rows.append(separator.join([fields[term] for term in row]) + end)
+            row_num += 1
+            if len(self.rows) >= buffer_rows:
+                self.flush()
+                
+        self.row_num += row_num
+        return row_num
     
-    # Unqualiification algorithm
-    def simplify(self):
-        rdf = RDF_Star_Graph()
+    # Write blocks of rows that are already encoded in the format of the
+    # writer, given as (block, number of rows), such as the blocks of
+    # translate_parallel with the same rdf_format
+    def writeEncoded(self, blocks):
+        row_num = 0
+        for block, block_rows in blocks:
+            self.rows.append(block)
+            row_num += block_rows
+            self.flush()
+            
+        self.row_num += row_num
+        return row_num
+    
+    # Sink interface of translate_to_sinks
+    def addAll(self, t_list):
+        self.writeAll(t_list)
         
-        for star_triple in self:
-            rdf.addAll(star_triple.getDeepestTriples())
+    def flush(self):
+        if self.rows:
+            self.file.write(b"".join(self.rows))
+            self.rows.clear()
             
-        return rdf
+    def close(self):
+        if not self.file.closed:
+            try:
+                self.flush()
+            finally:
+                self.file.close()
+            
+    def __enter__(self):
+        return self
     
-    # Convert from RDF* to RDF using standard reification
-    def decompose(self, star_format="n-triples"):
-        rdf = RDF_Star_Graph()
+    def __exit__(self, *exc_info):
+        self.close()
         
-        for star_triple in self:
-            if star_triple.isRDFTriple():
-                # Add a copy of the triple itself
-                rdf.add(star_triple, copy=True)
-            else:
-                # Decompose, then add them to the new graph
-                decomposed = star_triple.decompose(star_format=star_format)
-                rdf.addAll(decomposed)
+# Sink for translate_to_sinks that writes RDF triples to a tsv file
+TSV_Sink = Triple_Writer
+
+# Write RDF* triples to a file as they are generated. See Triple_Writer for
+# the formats and compression options. Returns the number of triples written
+def write_triples(file_name, triples, rdf_format="tsv", compression=None, level=None, threads=1):
+    with _phase("serialise"), Triple_Writer(file_name, rdf_format, compression, level, threads) as writer:
+        return writer.writeAll(_track(triples, "serialise.triples"))
+
+# Write RDF* triples to a tsv file as they are generated
+def write_tsv(file_name, triples, compression=None, level=None, threads=1):
+    write_triples(file_name, triples, "tsv", compression, level, threads)
+
+# Integer IDs of entities and relations for knowledge graph embedding,
+# given in order of first appearance from 0. Share one KGE_Ids between the
+# train, validation and test graphs so that their IDs agree. Terms are
+# keyed by name, so blank nodes and composite shortcut relations such as
+# "p/q^-1" get IDs like any other term, and graphs need not share a term
+# dictionary
+class KGE_Ids():
+    
+    def __init__(self):
+        self.entity_ids = dict()    # key: entity name, value: ID
+        self.relation_ids = dict()  # key: relation name, value: ID
         
-        return rdf 
+    # Get the ID of a name in one of the maps, adding it if it is new
+    @staticmethod
+    def __id(ids, name):
+        term_id = ids.get(name)
+        if term_id is None:
+            term_id = len(ids)
+            ids[name] = term_id
+        return term_id
     
-    # Convert from RDF* to RDF using standard reification + unqualification
-    def convertToRegularRDF(self, star_format="n-triples"):
-        rdf = RDF_Star_Graph()
+    def entityId(self, name):
+        return self.__id(self.entity_ids, str(name))
+    
+    def relationId(self, name):
+        return self.__id(self.relation_ids, str(name))
+    
+    # Get the head, relation and tail ID columns of the statements of a
+    # translated graph. Each term ID of the graph is only named once
+    def encodeGraph(self, graph):
+        terms = graph.terms.terms
+        entities = dict()   # key: term ID, value: entity ID
+        relations = dict()  # key: term ID, value: relation ID
+        heads, rels, tails = array('q'), array('q'), array('q')
         
-        for star_triple in self:
-            if star_triple.isRDFTriple():
-                # Add a copy of the triple itself
-                rdf.add(star_triple, copy=True)
+        for subj_id, pred_id, obj_id in zip(graph.subj_ids, graph.pred_ids, graph.obj_ids):
+            for term_id in (subj_id, obj_id):
+                if term_id not in entities:
+                    term = terms[term_id]
+                    if isinstance(term, tuple):
+                        raise ValueError("Only RDF triples can be exported, translate the graph first")
+                    entities[term_id] = self.entityId(term)
+            if pred_id not in relations:
+                relations[pred_id] = self.relationId(terms[pred_id])
+                
+            heads.append(entities[subj_id])
+            rels.append(relations[pred_id])
+            tails.append(entities[obj_id])
+        return heads, rels, tails
+    
+    # Write entity2id.txt and relation2id.txt: the number of names, then a
+    # "name<tab>ID" line for each
+    def save(self, out_dir):
+        for file_name, ids in (("entity2id.txt", self.entity_ids), ("relation2id.txt", self.relation_ids)):
+            with open(os.path.join(out_dir, file_name), 'w', encoding='utf-8') as out_file:
+                out_file.write(str(len(ids)) + "\n")
+                out_file.writelines(name + "\t" + str(term_id) + "\n" for name, term_id in ids.items())
+                
+# Export translated graphs as integer ID files for knowledge graph
+# embedding, in one pass over each graph. graphs maps split names to
+# graphs, e.g. {"train": ..., "valid": ..., "test": ...}, and a split
+# "train" is written to train2id.txt: the number of statements, then a
+# "head tail relation" line for each, as OpenKE reads them. With npy set,
+# it is written to train.npy instead, as an (n, 3) int64 array of head,
+# relation and tail columns, which needs numpy. entity2id.txt and
+# relation2id.txt are written for all the splits. Pass ids to carry on
+# from an earlier export. Returns the KGE_Ids used
+def export_kge(graphs, out_dir, ids=None, npy=False):
+    if ids is None:
+        ids = KGE_Ids()
+    os.makedirs(out_dir, exist_ok=True)
+    
+    with _phase("export_kge"):
+        for split, graph in graphs.items():
+            heads, rels, tails = ids.encodeGraph(graph)
+            if npy:
+                import numpy
+                columns = [numpy.frombuffer(column, dtype=numpy.int64) for column in (heads, rels, tails)]
+                numpy.save(os.path.join(out_dir, split + ".npy"), numpy.stack(columns, axis=1))
             else:
-                # Decompose, then add them to the new graph
-                decomposed = star_triple.decompose(star_format=star_format)
-                rdf.addAll(decomposed)
-                # Unqualify, then add them to the new graph
-                simplified = star_triple.getDeepestTriples()
-                rdf.addAll(simplified)
+                with open(os.path.join(out_dir, split + "2id.txt"), 'w', encoding='utf-8') as out_file:
+                    out_file.write(str(len(heads)) + "\n")
+                    for start in range(0, len(heads), 10000):
+                        end = start + 10000
+                        rows = map("{} {} {}\n".format, heads[start:end], tails[start:end], rels[start:end])
+                        out_file.write("".join(rows))
+            _count("export_kge." + split + ".statements", len(heads))
+        ids.save(out_dir)
         
-        return rdf            
+    _log("Number of entities and relations exported: ", len(ids.entity_ids), len(ids.relation_ids))
+    return ids
+
+# Translate RDF* triples one at a time with the named translation algorithm
+# Triples can be RDF* triples or tuples, e.g. from read_tsv
+def translate_stream(triples, algo, star_format="n-triples"):
+    if algo not in translation_algos:
+        raise ValueError("Unknown translation algorithm: " + str(algo))
+    translate_triple = translation_algos[algo]
+    emitted_name = "translate." + algo + ".triples_emitted"
     
-    # Convert from RDF* to RDF using symmetrical shortcut algorithm
-    def shortcutConvert(self):
-        rdf = RDF_Star_Graph()
-        
-        for star_triple in self:
-            # Decompose, then add them to the new graph
-            decomposed = star_triple.shortDecompose()
-            rdf.addAll(decomposed)
-        
-        return rdf
+    for triple in _track(triples, "translate." + algo + ".statements"):
+        if isinstance(triple, tuple):
+            triple = RDF_Star_Triple(triple[0], triple[1], triple[2])
+        output = translate_triple(triple, star_format)
+        if metrics is not None:
+            metrics.count(emitted_name, len(output))
+        yield from output
+
+# Lazy translation of a graph, or of any iterable of RDF* triples, that is
+# only computed while it is iterated. Nothing is kept between passes, so a
+# translation that is written out once never exists in memory as a whole.
+# Every pass has its own bn_dict, which starts empty, and gives the same
+# triples as performTranslationAlgo run from an empty bn_dict. Counting
+# and serialising each take a pass
+class Translation_View():
     
-    # Convert from RDF* to RDF using asymmetrical shortcut algorithm
-    def shortcutConvertV2(self):
-        rdf = RDF_Star_Graph()
+    def __init__(self, triples, algo, star_format="n-triples"):
+        if algo not in translation_algos:
+            raise ValueError("Unknown translation algorithm: " + str(algo))
+        self.triples = triples
+        self.algo = algo
+        self.star_format = star_format
         
-        for star_triple in self:
-            # Decompose, then add them to the new graph
-            decomposed = star_triple.shortDecomposeV2()
-            rdf.addAll(decomposed)
+    # bn_dict is only swapped around each translation, so passes can be
+    # interleaved with each other and with other translations. Blank nodes
+    # are named after their quoted triple, so every pass gives the same
+    # triples
+    def __iter__(self):
+        global bn_dict, bn_names
+        view_bn_dict = dict()
+        view_bn_names = dict()
+        translate_triple = translation_algos[self.algo]
+        star_format = self.star_format
         
-        return rdf
+        for triple in self.triples:
+            if isinstance(triple, tuple):
+                triple = RDF_Star_Triple(triple[0], triple[1], triple[2])
+            if triple._level == 0:
+                yield triple
+                continue
+            previous_bn_dict, previous_bn_names = bn_dict, bn_names
+            bn_dict, bn_names = view_bn_dict, view_bn_names
+            try:
+                output = translate_triple(triple, star_format)
+            finally:
+                bn_dict, bn_names = previous_bn_dict, previous_bn_names
+            yield from output
+            
+    def __len__(self):
+        return sum(1 for _ in self)
     
-    # Convert from RDF* to RDF using extended reification (symmetrical version)
-    def enhancedConvertV1(self, star_format="n-triples"):
-        rdf = RDF_Star_Graph()
+    def serialise(self, file_name, rdf_format="tsv", compression=None, level=None, threads=1):
+        row_num = write_triples(file_name, self, rdf_format, compression, level, threads)
+        _log("Number of RDF triples serialised: ", row_num)
         
-        for star_triple in self:
-            if star_triple.isRDFTriple():
-                # Add a copy of the triple itself
-                rdf.add(star_triple, copy=True)
-            else:
-                # Decompose, then add them to the new graph
-                decomposed = star_triple.decompose(star_format=star_format)
-                extra = star_triple.shortDecompose()
-                rdf.addAll(decomposed)
-                rdf.addAll(extra)
+    # Build the translated graph
+    def toGraph(self):
+        graph = RDF_Star_Graph()
+        graph.addAll(self)
+        return graph
 
-        return rdf
+# Translate RDF* triples with several translation algorithms in a single
+# pass. sinks maps algorithm names to sinks: objects with an addAll method,
+# such as RDF_Star_Graph or TSV_Sink, that are given the translation of each
+# triple in turn. Translations shared between algorithms, like the standard
+# reification in std_reification, std_reification_plus and extret, are
+# computed once per triple. The pass is a translation run of its own, so
+# each sink gets the same triples as a separate run of its algorithm
+def translate_to_sinks(triples, sinks, star_format="n-triples"):
+    for algo in sinks:
+        if algo not in translation_algos:
+            raise ValueError("Unknown translation algorithm: " + str(algo))
+    parts = {algo: composite_algos.get(algo, (algo,)) for algo in sinks}
+    base_algos = list(dict.fromkeys(chain.from_iterable(parts.values())))
     
-    # Convert from RDF* to RDF using extended reification (asymmetrical version)
-    # Aka ExtRet
-    def enhancedConvertV2(self, star_format="n-triples"):
-        rdf = RDF_Star_Graph()
-        
-        for star_triple in self:
-            if star_triple.isRDFTriple():
-                # Add a copy of the triple itself
-                rdf.add(star_triple, copy=True)
+    with _translation_run(), _phase("translate.shared"):
+        for triple in _track(triples, "translate.shared.statements"):
+            if isinstance(triple, tuple):
+                triple = RDF_Star_Triple(triple[0], triple[1], triple[2])
+            
+            if triple._level == 0:
+                outputs = {algo: [triple] for algo in sinks}
             else:
-                # Decompose, then add them to the new graph
-                decomposed = star_triple.decompose(star_format=star_format)
-                extra = star_triple.shortDecomposeV2()
-                rdf.addAll(decomposed)
-                rdf.addAll(extra)
-        
-        return rdf
+                translations = {base: translation_algos[base](triple, star_format) for base in base_algos}
+                outputs = {algo: translations[algo_parts[0]] if len(algo_parts) == 1 
+                                 else list(chain.from_iterable(translations[base] for base in algo_parts))
+                           for algo, algo_parts in parts.items()}
+                
+            for algo, sink in sinks.items():
+                output = outputs[algo]
+                sink.addAll(output)
+                if metrics is not None:
+                    metrics.count("translate." + algo + ".triples_emitted", len(output))
+
+# Translate RDF* triples with the named translation algorithm on a pool of
+# processes. Triples are sent to the workers in chunks of flat tsv rows, so
+# there is no limit on nesting depth, and each worker starts every chunk
+# with an empty bn_dict. Blank nodes are named after their quoted triple,
+# rather than labelled in order as in a single process run, so the workers
+# agree on names without talking to each other. The output triples come back
+# as rows of terms rendered as strings, (s, p, o), which
+# RDF_Star_Graph.addRows and Triple_Writer.writeRows take as they are. With
+# rdf_format set to one of the formats of Triple_Writer, the workers encode
+# the rows in that format instead, and each chunk comes back as a single
+# block of bytes. The blocks are generated as (block, number of rows), for
+# Triple_Writer.writeEncoded. Reification rows of blank nodes that an
+# earlier chunk already output are dropped here by name, in input order
+# The run starts from no blank nodes, and bn_dict is neither used nor
+# updated
+def translate_parallel(triples, algo, star_format="n-triples", processes=None, chunk_size=10000, rdf_format=None):
+    if algo not in translation_algos:
+        raise ValueError("Unknown translation algorithm: " + str(algo))
+    if rdf_format is not None:
+        _row_format(rdf_format)
     
-    # Replace all old nodes containing certain values with new nodes
-    def replaceAll(self, old, new):
-        for triple in self.triples_list:
-            triple.replaceAll(old, new)
-            
-    # Parse Tab-Separated-Values
-    def parse(self, file_name):
-        file = open(file_name, encoding='utf-8')
-        read_file = csv.reader(file, delimiter="\t")
+    # Names of all blank nodes whose reification rows were output
+    emitted = set()
+    triples = _track(triples, "translate." + algo + ".statements")
+    emitted_name = "translate." + algo + ".triples_emitted"
+    
+    with multiprocessing.Pool(processes) as pool:
+        max_pending = 2 * (processes or multiprocessing.cpu_count())
+        pending = deque()
+        chunks = _chunk_rows(triples, chunk_size)
         
-        row_num = 0
-        for row in read_file:
-            self.add(self.__parse_row(Buffer(row)))
-            row_num += 1
+        while True:
+            # Keep a bounded number of chunks in flight
+            for chunk in islice(chunks, max_pending - len(pending)):
+                pending.append(pool.apply_async(_translate_chunk, (chunk, algo, star_format, rdf_format)))
+            if not pending:
+                break
+            
+            rows, (names, counts, positions) = pending.popleft().get()
+            dropped = ()
+            if not emitted.isdisjoint(names):
+                dropped = _repeated_rows(names, counts, positions, emitted)
+            emitted_before = len(emitted)
+            emitted.update(names)
+            _count("blank_nodes.minted", len(emitted) - emitted_before)
             
-        print("Number of RDF* triples parsed: ", row_num)
+            if rdf_format is None:
+                if dropped:
+                    dropped = set(dropped)
+                    rows = [row for position, row in enumerate(rows) if position not in dropped]
+                _count(emitted_name, len(rows))
+                yield from rows
+            else:
+                block, row_num = _drop_rows(rows[0], rows[1], dropped)
+                _count(emitted_name, row_num)
+                yield block, row_num
+                
+# Positions of the reification rows of blank nodes already emitted, in
+# order. names lists the blank nodes of a chunk, counts the number of
+# reification rows of each, and positions those rows one blank node after
+# another
+def _repeated_rows(names, counts, positions, emitted):
+    dropped = []
+    start = 0
+    for name, count in zip(names, counts):
+        if name in emitted:
+            dropped.extend(positions[start:start + count])
+        start += count
+    return sorted(dropped)
 
-    # Parse each row in tsv file
-    def __parse_row(self, buffer):
-        storage = []
+# Cut the rows at the given positions, in order, out of a block of encoded
+# rows whose ends are given. Returns the block and its number of rows
+def _drop_rows(block, ends, dropped):
+    if not dropped:
+        return block, len(ends)
+    pieces = []
+    start = 0
+    for position in dropped:
+        pieces.append(block[start:ends[position - 1] if position > 0 else 0])
+        start = ends[position]
+    pieces.append(block[start:])
+    return b"".join(pieces), len(ends) - len(dropped)
+            
+# Split RDF* triples into lists of tsv rows for sending to worker
+# processes. Flat rows pickle at any nesting depth, where nested tuples
+# run out of recursion. Rows of tokens, as read by csv.reader, are sent as
+# they are
+def _chunk_rows(triples, chunk_size):
+    chunk = []
+    for triple in triples:
+        if isinstance(triple, list):
+            chunk.append(triple)
+        elif isinstance(triple, tuple):
+            row = _leaves(triple, _tuple_tokens)
+            row.append(".")
+            chunk.append(row)
+        else:
+            chunk.append(triple_to_ntx(triple))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+        
+# Nested tuples are written between "<<" and ">>", as by _ntx_tokens
+def _tuple_tokens(term):
+    if isinstance(term, tuple):
+        return ("<<", term[0], term[1], term[2], ">>")
+    return ()
 
-        # Each row is in list format
-        # Triples must have three elements
-        for _ in range(3):
-            if buffer.current() == "<<":
-                buffer.strip()  # Remove "<<"
-                parsed = self.__parse_row(buffer) # Parse the nested triple
-                storage.append(parsed)  # Add to storage
-                buffer.strip()  # Remove ">>"
-            else:
-                storage.append(buffer.current()) # Add to storage
-                buffer.strip()  # Remove element
+# Term encodings of the worker processes of translate_parallel, kept from
+# one chunk to the next. key: rdf_format, value: (_Term_Fields, row end)
+_chunk_formats = dict()
 
-        return (storage[0], storage[1], storage[2])
+# Translate one chunk of tsv rows of RDF* triples in a worker process
+# Returns the rows of the output triples, and the blank nodes minted (as
+# strings) with the positions of their reification rows, flattened as for
+# _repeated_rows so they are quick to send back. Encoded rows are returned
+# as their block of bytes and the end of each row
+def _translate_chunk(chunk, algo, star_format, rdf_format=None):
+    global bn_names
+    bn_dict.clear()
+    bn_names = dict()
+    translate_triple = translation_algos[algo]
+    if rdf_format is not None:
+        if rdf_format not in _chunk_formats:
+            _chunk_formats[rdf_format] = _row_format(rdf_format)
+        fields, end = _chunk_formats[rdf_format]
+        separator = fields.separator
     
-    def serialise(self, file_name):
-        with open(file_name, 'w', encoding='utf-8', newline="") as out_file:
-            writer = csv.writer(out_file, delimiter="\t")
+    rows = []
+    reification = dict()    # key: blank node, value: positions of its reification rows
+    for row in chunk:
+        triple = _parse_row(row)
+        for output in translate_triple(RDF_Star_Triple(triple[0], triple[1], triple[2]), star_format):
+            subj = output.subj
+            if isinstance(subj, Blank_Node) and output.pred in reification_preds:
+                reification.setdefault(subj, []).append(len(rows))
+            if rdf_format is None:
+                rows.append((str(subj), output.pred, str(output.obj)))
+            else:
+                rows.append(fields[subj] + separator + fields[output.pred] + separator + fields[output.obj] + end)
             
-            row_num = 0
-            for triple in self.triples_list:
-                writer.writerow(self.convertToNTXStyle(triple))
-                row_num += 1
-                
-            print("Number of RDF triples serialised: ", row_num)
+    minted = set(bn_dict.values())
+    names = []
+    counts = array('q')
+    positions = array('q')
+    for blank, blank_positions in reification.items():
+        if blank in minted:
+            names.append(str(blank))
+            counts.append(len(blank_positions))
+            positions.extend(blank_positions)
+            
+    if rdf_format is not None:
+        rows = (b"".join(rows), array('q', accumulate(map(len, rows))))
+    return rows, (names, counts, positions)
+
+# Remove duplicate triples from a stream, keeping the first copy of each in
+# input order. Duplicates are found with a set of 64 or 128 bit hashes of
+# the triples until it holds max_fingerprints of them. The rest of the
+# stream is then deduplicated with an external sort in temporary files
+def dedup_triples(triples, max_fingerprints=10000000, fingerprint_bits=64, run_size=1000000, temp_dir=None):
+    fingerprint_bytes = fingerprint_bits // 8
+    seen = set()
+    triples = iter(triples)
     
-    def convertToNTXStyle(self, triple):
-        ntx_list = list()
-        if isinstance(triple.subj, RDF_Star_Triple):
-            ntx_list.append("<<") # Indicate start of nested triple
-            ntx_list.extend(self.convertToNTXStyle(triple.subj)[:-1]) # Add nested triple contents, but remove "."
-            ntx_list.append(">>") # Indicate end of nested triple
+    for triple in triples:
+        key = _dedup_key(triple)
+        fingerprint = hashlib.blake2b(key, digest_size=fingerprint_bytes).digest()
+        if fingerprint in seen:
+            _count("dedup.duplicates")
+            continue
+        
+        if len(seen) >= max_fingerprints:
+            # Out of memory for fingerprints
+            yield from _external_dedup(chain([triple], triples), seen, fingerprint_bytes, run_size, temp_dir)
+            return
+        
+        seen.add(fingerprint)
+        yield triple
+        
+# Triples are compared by their tsv row. Rows of terms from
+# translate_parallel give the same key as their triples
+def _dedup_key(triple):
+    if isinstance(triple, tuple):
+        return ("\t".join(triple) + "\t.").encode('utf-8')
+    return "\t".join(map(str, triple_to_ntx(triple))).encode('utf-8')
+
+# External sort-and-merge deduplication, keeping input order. Triples already
+# output (with fingerprints in seen) are dropped. The keys of the rest are
+# sorted into runs by (key, position), merged to keep the first copy of each
+# key, then sorted back into input order through a second set of runs.
+# Triples are rebuilt from their keys, so only keys and positions are
+# written out. Blank nodes compare by identity, so the live ones are kept
+# by their text and put back in the rebuilt triples
+def _external_dedup(triples, seen, fingerprint_bytes, run_size, temp_dir):
+    blank_nodes = dict()    # key: text of a blank node, value: the blank node
+    rows = None             # streams hold either tsv rows or RDF* triples
+    key_runs = []
+    run = []
+    for position, triple in enumerate(triples):
+        if rows is None:
+            rows = isinstance(triple, tuple)
+        if rows:
+            key = _dedup_key(triple)
         else:
-            ntx_list.append(triple.subj)
+            tokens = triple_to_ntx(triple)
+            for token in tokens:
+                if isinstance(token, Blank_Node):
+                    blank_nodes[str(token)] = token
+            key = "\t".join(map(str, tokens)).encode('utf-8')
+        if hashlib.blake2b(key, digest_size=fingerprint_bytes).digest() in seen:
+            continue
+        run.append((key, position))
+        if len(run) == run_size:
+            key_runs.append(_write_run(run, temp_dir))
+            run = []
+    if run:
+        key_runs.append(_write_run(run, temp_dir))
+    run = []
         
-        ntx_list.append(triple.pred)
+    position_runs = []
+    last_key = None
+    for key, position in heapq.merge(*map(_read_run, key_runs)):
+        if key == last_key:
+            continue
+        last_key = key
+        run.append((position, key))
+        if len(run) == run_size:
+            position_runs.append(_write_run(run, temp_dir))
+            run = []
+    if run:
+        position_runs.append(_write_run(run, temp_dir))
         
-        if isinstance(triple.obj, RDF_Star_Triple):
-            ntx_list.append("<<")
-            ntx_list.extend(self.convertToNTXStyle(triple.obj)[:-1])
-            ntx_list.append(">>")
+    for _, key in heapq.merge(*map(_read_run, position_runs)):
+        tokens = key.decode('utf-8').split("\t")
+        del tokens[-1]
+        if rows:
+            yield tuple(tokens)
         else:
-            ntx_list.append(triple.obj)
-            
-        ntx_list.append(".")
+            subj, pred, obj = _parse_row([blank_nodes.get(token, token) for token in tokens])
+            yield RDF_Star_Triple(subj, pred, obj)
         
-        return ntx_list
+# Sort a run and write it to a temporary file, which is deleted on close
+def _write_run(run, temp_dir):
+    run.sort()
+    file = tempfile.TemporaryFile(dir=temp_dir)
+    for item in run:
+        pickle.dump(item, file, pickle.HIGHEST_PROTOCOL)
+    file.seek(0)
+    return file
+
+# Read back a sorted run, closing the file at the end
+def _read_run(file):
+    with file:
+        while True:
+            try:
+                yield pickle.load(file)
+            except EOFError:
+                return
+
+# Translate a tsv file of RDF* triples into a tsv file of RDF triples without
+# holding either graph in memory. Gives the same output as parse,
+# performTranslationAlgo and serialise, as both are translation runs of
+# their own. Only bn_dict grows with the input, by one entry per distinct
+# quoted triple, and so does the dedup stage when dedup is set. The output
+# is written with Triple_Writer, in out_format and with the given
+# compression options
+def stream_translation(in_file_name, out_file_name, algo, star_format="n-triples", processes=1, chunk_size=10000, 
+                       rdf_format="tsv", dedup=False, out_format="tsv", compression=None, threads=1):
+    if processes == 1:
+        triples = translate_stream(read_triples(in_file_name, rdf_format), algo, star_format)
+    else:
+        # tsv rows are parsed by the workers
+        if rdf_format == "tsv":
+            triples = _read_tsv_rows(in_file_name)
+        else:
+            triples = read_triples(in_file_name, rdf_format)
+        # Rows are only encoded by the workers when they need not be deduplicated
+        triples = translate_parallel(triples, algo, star_format, processes, chunk_size, None if dedup else out_format)
+    if dedup:
+        triples = dedup_triples(triples)
+    # The stages are generators, so all of the translation runs inside the block
+    with _translation_run():
+        writer = Triple_Writer(out_file_name, out_format, compression, threads=threads)
+        with _phase("stream_translation"), writer:
+            if processes == 1:
+                _count("serialise.triples", writer.writeAll(triples))
+            elif dedup:
+                _count("serialise.triples", writer.writeRows(triples))
+            else:
+                _count("serialise.triples", writer.writeEncoded(triples))
+
+# Translate a file of RDF* triples with several algorithms in one pass,
+# writing a file for each. out_file_names maps algorithm names to the
+# files to write
+def stream_translations(in_file_name, out_file_names, star_format="n-triples", rdf_format="tsv",
+                        out_format="tsv", compression=None, threads=1):
+    for algo in out_file_names:
+        if algo not in translation_algos:
+            raise ValueError("Unknown translation algorithm: " + str(algo))
+    
+    with ExitStack() as stack:
+        sinks = {algo: stack.enter_context(Triple_Writer(file_name, out_format, compression, threads=threads))
+                 for algo, file_name in out_file_names.items()}
+        translate_to_sinks(read_triples(in_file_name, rdf_format), sinks, star_format)
+
+# Filter leakage from train into validation and test statements
+# The train file is streamed once into sets of term IDs for its statements,
+# entities and relations, and a Term_Dictionary that also holds every triple
+# quoted in it. Validation and test files are then streamed through filter,
+# which drops statements that are
+#   duplicate:       asserted in train
+#   quoted:          quoting a triple (at any depth) that is asserted or
+#                    quoted in train
+#   unseen_entity:   using an entity that is not in train
+#   unseen_relation: using a relation that is not in train
+# as chosen per file. Each dropped statement is counted under the first
+# reason that applies
+class Leakage_Filter():
+    
+    def __init__(self, train_file_name, rdf_format="tsv"):
+        self.terms = Term_Dictionary()
+        self.statements = set()
+        self.entity_ids = set()
+        self.relation_ids = set()
         
-    def __str__(self):
-        return str([str(elem) for elem in self.triples_list])
+        terms = self.terms
+        with _phase("leakage.train"):
+            for triple in _track(read_triples(train_file_name, rdf_format), "leakage.train_statements"):
+                triple = RDF_Star_Triple(triple[0], triple[1], triple[2])
+                subj_id = terms.intern(triple.subj)
+                pred_id = terms.intern(triple.pred)
+                obj_id = terms.intern(triple.obj)
+                self.statements.add(terms.intern((subj_id, pred_id, obj_id)))
+                self.entity_ids.update(terms.statementEntities(subj_id, obj_id))
+                self.relation_ids.update(terms.statementRelations(subj_id, pred_id, obj_id))
+                
+    # Get the reason to drop an RDF* triple, or None to keep it
+    def check(self, triple, duplicates=True, quoted=True, unseen=True):
+        terms = self.terms
+        if duplicates and terms.find(triple) in self.statements:
+            return "duplicate"
+        if quoted:
+            for term in (triple.subj, triple.obj):
+                if isinstance(term, RDF_Star_Triple) and self.__quotesTrain(term):
+                    return "quoted"
+        if unseen:
+            if any(terms.find(ent) not in self.entity_ids for ent in triple_entities(triple)):
+                return "unseen_entity"
+            if any(terms.find(rel) not in self.relation_ids for rel in triple_relations(triple)):
+                return "unseen_relation"
+        return None
     
-    def __iter__(self):
-        return RDF_Star_Iterator(self)
+    # Check if a quoted triple, or any triple quoted inside it, is in train
+    def __quotesTrain(self, triple):
+        find = self.terms.find
+        return any(find(quoted) is not None for quoted in _visit((triple,), _quoted_triples))
     
-class RDF_Star_Iterator(): # This class will allow the graph object to be iterable
+    # Write the statements of a file that pass the filter to a tsv file
+    # Returns a report of how many statements were read, kept and dropped
+    # for each reason
+    def filter(self, in_file_name, out_file_name, rdf_format="tsv", duplicates=True, quoted=True, unseen=True):
+        report = {"statements": 0, "kept": 0, "duplicate": 0, "quoted": 0, 
+                  "unseen_entity": 0, "unseen_relation": 0}
+        
+        def kept_triples():
+            for triple in read_triples(in_file_name, rdf_format):
+                triple = RDF_Star_Triple(triple[0], triple[1], triple[2])
+                report["statements"] += 1
+                reason = self.check(triple, duplicates, quoted, unseen)
+                if reason is None:
+                    report["kept"] += 1
+                    yield triple
+                else:
+                    report[reason] += 1
+                    
+        with _phase("leakage.filter"):
+            write_tsv(out_file_name, kept_triples())
+        for reason in ("duplicate", "quoted", "unseen_entity", "unseen_relation"):
+            _count("leakage." + reason, report[reason])
+        return report
+
+# Filter the validation and test splits of a train/validation/test split
+# Validation drops duplicate and quoted statements, test also drops
+# statements with entities or relations unseen in train
+def filter_splits(train_file_name, valid_file_name, test_file_name, valid_out_file_name, test_out_file_name, 
+                  rdf_format="tsv"):
+    leakage_filter = Leakage_Filter(train_file_name, rdf_format)
+    return {"valid": leakage_filter.filter(valid_file_name, valid_out_file_name, rdf_format, unseen=False),
+            "test": leakage_filter.filter(test_file_name, test_out_file_name, rdf_format)}
+
+# Translation of an RDF* graph that changes over time. Every output RDF
+# triple is counted once for each source statement whose translation
+# contains it, so a delta of added and removed statements gives the output
+# triples that appear and disappear without translating the rest of the
+# graph again. Reification triples are retracted once no statement quotes
+# their fact any more. Blank nodes are named after their quoted triple, so
+# they stay the same from one delta to the next without keeping bn_dict
+# The output is a set, as with dedup in performTranslationAlgo. Statements
+# and output triples are kept as term ID tuples, and the term dictionary
+# only grows
+class Incremental_Translation():
     
-    def __init__(self, rdf_star):
-        self.rdf_star = rdf_star
-        self.index = 0 # initialise index
+    def __init__(self, algo, star_format="n-triples"):
+        if algo not in translation_algos:
+            raise ValueError("Unknown translation algorithm: " + str(algo))
+        self.algo = algo
+        self.star_format = star_format
+        self.terms = Term_Dictionary()
+        self.statements = dict()    # key: source statement as an ID tuple, value: number of copies
+        self.counts = dict()        # key: output triple as an ID tuple, value: number of statements producing it
         
-    def __next__(self):
-        if self.index < len(self.rdf_star.triples_list):
-            result = self.rdf_star.triples_list[self.index]
-            self.index += 1
-            return result
-        raise StopIteration
+    # Apply a delta of RDF* triples (or tuples) to the source graph. Removed
+    # statements that are not in the graph are ignored, and removals are
+    # applied before additions
+    # Returns the lists of output triples that were added and removed
+    def apply(self, added=(), removed=()):
+        changed = dict()    # key: output triple as an ID tuple, value: its count before the delta
         
-class Buffer():
+        # Each statement is translated from an empty bn_dict, so its
+        # translation holds all of its reification triples
+        global bn_dict, bn_names
+        previous_bn_dict, previous_bn_names = bn_dict, bn_names
+        bn_dict = dict()
+        bn_names = dict()
+        try:
+            with _phase("incremental." + self.algo):
+                for triple in _track(removed, "incremental.statements_removed"):
+                    self.__update(triple, -1, changed)
+                for triple in _track(added, "incremental.statements_added"):
+                    self.__update(triple, 1, changed)
+        finally:
+            bn_dict, bn_names = previous_bn_dict, previous_bn_names
+            
+        counts = self.counts
+        added_triples = []
+        removed_triples = []
+        for key, before in changed.items():
+            after = counts.get(key, 0)
+            if before == 0 and after > 0:
+                added_triples.append(self.__triple(key))
+            elif before > 0 and after == 0:
+                removed_triples.append(self.__triple(key))
+                
+        _count("incremental.triples_added", len(added_triples))
+        _count("incremental.triples_removed", len(removed_triples))
+        return added_triples, removed_triples
     
-    def __init__(self, row_values):
-        self.row_values = row_values
-        
-    # Remove first element from buffer
-    def strip(self):
-        self.row_values = self.row_values[1:] 
+    # Add (delta 1) or remove (delta -1) a source statement, and count the
+    # output triples of its translation
+    def __update(self, triple, delta, changed):
+        if isinstance(triple, tuple):
+            triple = RDF_Star_Triple(triple[0], triple[1], triple[2])
+        terms = self.terms
+        statements = self.statements
         
-    # Get the current first element from buffer
-    def current(self):
-        return self.row_values[0] 
-
+        if delta > 0:
+            key = (terms.intern(triple.subj), terms.intern(triple.pred), terms.intern(triple.obj))
+            statements[key] = statements.get(key, 0) + 1
+        else:
+            key = (terms.find(triple.subj), terms.find(triple.pred), terms.find(triple.obj))
+            copies = statements.get(key, 0)
+            if copies == 0:
+                return
+            if copies == 1:
+                del statements[key]
+            else:
+                statements[key] = copies - 1
+            
+        bn_dict.clear()
+        counts = self.counts
+        intern = terms.intern
+        for output in set(translation_algos[self.algo](triple, self.star_format)):
+            output_key = (intern(output.subj), intern(output.pred), intern(output.obj))
+            count = counts.get(output_key, 0)
+            if output_key not in changed:
+                changed[output_key] = count
+            count += delta
+            if count:
+                counts[output_key] = count
+            else:
+                del counts[output_key]
+                
+    def __triple(self, key):
+        lookup = self.terms.lookup
+        return RDF_Star_Triple(lookup(key[0]), lookup(key[1]), lookup(key[2]))
+    
+    # Get the current translation as a graph
+    def toGraph(self):
+        graph = RDF_Star_Graph()
+        graph.addAll(self.__triple(key) for key in self.counts)
+        return graph
+    
+    # Number of distinct output triples
+    def __len__(self):
+        return len(self.counts)
 
 '''
    The following functions are only available for RDF* triples with
@@ -546,40 +3089,205 @@ class Buffer():
         RDF* triples with format ((s, p, o), p, o)
 '''
 
-# Parse triples from csv file
-def parse_csv(file_name):
-    file = open(file_name, encoding='utf-8')
-    read_file = csv.reader(file, delimiter=",")
-    graph = RDF_Star_Graph()
+# Hyper-relational statement: a main RDF triple with any number of
+# qualifiers, as in a csv row s,p,o,q1,v1,q2,v2,... The qualifiers are a
+# flat tuple of relations and values. A statement with qualifiers stands
+# for the RDF* triples ((s, p, o), q, v) of its qualifiers, and one
+# without stands for its main triple
+class Hyper_Statement():
     
-    for row in read_file:
-        length = len(row)
+    __slots__ = ("main", "qualifiers")
+    
+    def __init__(self, main, qualifiers=()):
+        if isinstance(main, tuple):
+            main = RDF_Star_Triple(main[0], main[1], main[2])
+        self.main = main
+        self.qualifiers = tuple(qualifiers)
+        if len(self.qualifiers) % 2:
+            raise ValueError("Qualifier without a value: " + str(self.qualifiers[-1]))
         
-        if length == 3:
-            graph.add(RDF_Star_Triple(row[0], row[1], row[2]), copy=False)
+    # Get the (relation, value) pairs of the qualifiers
+    def qualifierPairs(self):
+        qualifiers = self.qualifiers
+        return list(zip(qualifiers[0::2], qualifiers[1::2]))
+    
+    # Get the RDF* triples the statement stands for
+    def triples(self):
+        if not self.qualifiers:
+            return [self.main]
+        return [RDF_Star_Triple(self.main, rel, value) for rel, value in self.qualifierPairs()]
+    
+    def __eq__(self, other):
+        if not isinstance(other, Hyper_Statement):
+            return NotImplemented
+        return self.main == other.main and self.qualifiers == other.qualifiers
+    
+    def __hash__(self):
+        return hash((self.main, self.qualifiers))
+    
+    def __str__(self):
+        return "(" + ", ".join(map(str, (self.main,) + self.qualifiers)) + ")"
+    
+# Graph of hyper-relational statements. The main triple of each statement
+# is stored once for all of its qualifiers, as a quoted triple ID, and the
+# qualifiers as a flat column of relation and value IDs. The term
+# dictionary can be shared with other graphs by passing it in
+class Hyper_Graph():
+    
+    def __init__(self, terms=None):
+        self.terms = Term_Dictionary() if terms is None else terms
+        self.main_ids = array('q')
+        self.qualifier_ids = array('q')     # Relation and value IDs of the qualifiers of all statements
+        self.qualifier_ends = array('q')    # key: statement, value: end of its qualifiers in qualifier_ids
+        
+    def add(self, statement):
+        intern = self.terms.intern
+        self.main_ids.append(intern(statement.main))
+        self.qualifier_ids.extend(map(intern, statement.qualifiers))
+        self.qualifier_ends.append(len(self.qualifier_ids))
+        
+    def addAll(self, statements):
+        for statement in statements:
+            self.add(statement)
+            
+    # Get the term IDs of the main triple and the qualifiers of a statement
+    def statementIds(self, index):
+        start = self.qualifier_ends[index - 1] if index > 0 else 0
+        return self.main_ids[index], self.qualifier_ids[start:self.qualifier_ends[index]]
+    
+    def getStatement(self, index):
+        lookup = self.terms.lookup
+        main_id, qualifier_ids = self.statementIds(index)
+        return Hyper_Statement(lookup(main_id), map(lookup, qualifier_ids))
+    
+    def __iter__(self):
+        return map(self.getStatement, range(len(self)))
+    
+    def __len__(self):
+        return len(self.main_ids)
+    
+    # Get the RDF* graph of the triples the statements stand for. It shares
+    # the term dictionary, and is built straight from the term IDs
+    def toGraph(self):
+        graph = RDF_Star_Graph(self.terms)
+        terms = self.terms.terms
+        subj_ids, pred_ids, obj_ids = array('q'), array('q'), array('q')
         
-        elif length > 3:
-            for i in range(3, length, 2):
-                graph.add(RDF_Star_Triple((row[0], row[1], row[2]), row[i], row[i+1]), copy=False)
+        for index in range(len(self)):
+            main_id, qualifier_ids = self.statementIds(index)
+            if not qualifier_ids:
+                main = terms[main_id]
+                subj_ids.append(main[0])
+                pred_ids.append(main[1])
+                obj_ids.append(main[2])
+                continue
+            for i in range(0, len(qualifier_ids), 2):
+                subj_ids.append(main_id)
+                pred_ids.append(qualifier_ids[i])
+                obj_ids.append(qualifier_ids[i + 1])
                 
+        graph.subj_ids, graph.pred_ids, graph.obj_ids = subj_ids, pred_ids, obj_ids
+        return graph
+    
+    # Translate the statements with the named translation algorithm. The
+    # result is the same as translating toGraph(), see translate_hyper
+    def performTranslationAlgo(self, algo, star_format="n-triples"):
+        if algo not in translation_algos:
+            return None
+        rdf = RDF_Star_Graph()
+        with _translation_run(), _phase("translate_hyper." + algo):
+            for statement in _track(self, "translate_hyper." + algo + ".statements"):
+                rdf.addAll(translate_hyper(statement, algo, star_format))
+        _count("translate_hyper." + algo + ".triples_emitted", len(rdf))
+        return rdf
+    
+    # Write the statements to a csv file, one row per statement with its
+    # qualifiers, as parse_csv reads them back
+    def serialise(self, file_name, compression=None, level=None, threads=1):
+        with _phase("serialise"), Triple_Writer(file_name, "csv", compression, level, threads) as writer:
+            writer.writeRows(self.statementRows(), self.terms)
+        _log("Number of hyper-relational statements serialised: ", writer.row_num)
+        
+    # Rows of term IDs of the statements, the main triple followed by the
+    # qualifiers, as serialise writes them
+    def statementRows(self):
+        terms = self.terms.terms
+        for index in range(len(self)):
+            main_id, qualifier_ids = self.statementIds(index)
+            yield terms[main_id] + tuple(qualifier_ids)
+            
+# Translate a hyper-relational statement with the named translation
+# algorithm. Gives the same triples, in the same order, as translating the
+# RDF* triples of its qualifiers one after another, but the main triple is
+# only looked up and translated once for all the qualifiers. Statements
+# with a quoted triple inside them are translated through their triples
+def translate_hyper(statement, algo, star_format="n-triples"):
+    main = statement.main
+    if main._level > 0 or any(isinstance(term, RDF_Star_Triple) for term in statement.qualifiers):
+        translate_triple = translation_algos[algo]
+        return list(chain.from_iterable(translate_triple(triple, star_format) for triple in statement.triples()))
+    pairs = statement.qualifierPairs()
+    if not pairs:
+        return [main]
+    
+    # key: base algorithm, value: translation of each qualifier
+    translations = dict()
+    for base in composite_algos.get(algo, (algo,)):
+        if base == "unqualiification":
+            translations[base] = [(main,)] * len(pairs)
+        elif base == "std_reification":
+            blank, reification = _quoted_blank_node(main, _reification_tags(star_format))
+            translations[base] = [(RDF_Star_Triple(blank, rel, value),) for rel, value in pairs]
+            translations[base][0] = reification + translations[base][0]
+        else:
+            inverse = "^-1" if base == "shortcut_asymmetric" else ""
+            translations[base] = [(main, RDF_Star_Triple(main.subj, main.pred + "/" + rel, value),
+                                   RDF_Star_Triple(main.obj, main.pred + inverse + "/" + rel, value))
+                                  for rel, value in pairs]
+            
+    triples = []
+    for i in range(len(pairs)):
+        for parts in translations.values():
+            triples.extend(parts[i])
+    return triples
+
+# Read hyper-relational statements from a csv file, one per row. Rows
+# with less than three terms, such as blank lines, are skipped
+def read_csv(file_name):
+    with _open_input(file_name) as file:
+        for row in csv.reader(file, delimiter=","):
+            if len(row) >= 3:
+                yield Hyper_Statement((row[0], row[1], row[2]), row[3:])
+
+# Parse triples from csv file. With hyper set, the rows are kept whole in
+# a Hyper_Graph instead of being split into an RDF* triple per qualifier
+def parse_csv(file_name, hyper=False):
+    if hyper:
+        graph = Hyper_Graph()
+        graph.addAll(read_csv(file_name))
+        return graph
+    
+    graph = RDF_Star_Graph()
+    for statement in read_csv(file_name):
+        graph.addAll(statement.triples())
     return graph
 
 # Serialise triples to csv file
-def serialise_csv(file_name, graph):
-    with open(file_name, 'w', encoding='utf-8', newline="") as out_file:
-        writer = csv.writer(out_file, delimiter=",")
-        for triple in graph:
-            if triple.isRDFTriple():
-                writer.writerow([triple.subj, triple.pred, triple.obj])
-            else:
-                writer.writerow([triple.subj.subj, triple.subj.pred, triple.subj.obj, triple.pred, triple.obj])
+def serialise_csv(file_name, graph, compression=None, level=None, threads=1):
+    with _phase("serialise"), Triple_Writer(file_name, "csv", compression, level, threads) as writer:
+        if isinstance(graph, Hyper_Graph):
+            writer.writeRows(graph.statementRows(), graph.terms)
+        elif isinstance(graph, RDF_Star_Graph):
+            _count("serialise.triples", writer.writeGraph(graph))
+        else:
+            writer.writeAll(_track(graph, "serialise.triples"))
 
 # Get all entites and predicates
 def get_entities_and_predicates(file_name):
     entities = set()
     predicates = set()
     
-    file = open(file_name, encoding='utf-8')
+    file = _open_input(file_name)
     read_file = csv.reader(file, delimiter=",")
     
     for row in read_file:
@@ -599,16 +3307,83 @@ def pick_random_entities(file_name, num_of_entities):
     random_entities = random.choices(list(entities), k=num_of_entities)
     return random_entities
 
+# Get a random number generator. An int seeds a new generator, a
+# random.Random instance is used as it is, and None uses the functions of
+# the random module, so random.seed still applies
+def _make_rng(rng):
+    if rng is None or rng is random:
+        return random
+    elif isinstance(rng, random.Random):
+        return rng
+    return random.Random(rng)
+
+# Pick random entity IDs from graph in one bulk draw
+# With weighted set, entities are picked in proportion to the number of
+# statements they appear in. Other iterables of triples, such as lists or
+# translation views, are scanned, and their entity names stand in for IDs
+def pick_random_entity_ids(graph, num_of_entities, rng=None, replace=True, weighted=False):
+    rng = _make_rng(rng)
+    if not weighted:
+        entity_ids = graph.entity_ids if isinstance(graph, RDF_Star_Graph) else graph_entities(graph)
+        if replace:
+            return rng.choices(entity_ids, k=num_of_entities)
+        # Positions are sampled, as random.sample only takes an array of IDs
+        # from Python 3.10 on. The draw is the same
+        return [entity_ids[i] for i in rng.sample(range(len(entity_ids)), num_of_entities)]
+    
+    entity_ids, weights = _entity_weights(graph)
+    if replace:
+        return rng.choices(entity_ids, cum_weights=list(accumulate(weights)), k=num_of_entities)
+    
+    # Weighted sampling without replacement (Efraimidis-Spirakis): keep the
+    # entities with the largest random keys u^(1/weight)
+    if num_of_entities > len(entity_ids):
+        raise ValueError("Sample larger than number of entities")
+    keys = {ent: rng.random() ** (1 / weight) for ent, weight in zip(entity_ids, weights)}
+    return heapq.nlargest(num_of_entities, entity_ids, key=keys.__getitem__)
+
+# Get the entities of a graph with the number of statements each one
+# appears in, in order of first appearance
+def _entity_weights(graph):
+    if isinstance(graph, RDF_Star_Graph):
+        entity_index = graph.entity_index
+        return graph.entity_ids, [len(entity_index[ent]) for ent in graph.entity_ids]
+    
+    weights = dict()    # key: entity name, value: number of statements
+    for triple in graph:
+        for ent in triple_entities(triple):
+            weights[ent] = weights.get(ent, 0) + 1
+    return list(weights), list(weights.values())
+
 # Pick random entities from graph
-def pick_random_entities_graph(graph, num_of_entities):
-    entities = graph_entities(graph)
-    random_entities = random.choices(entities, k=num_of_entities)
-    return random_entities
+def pick_random_entities_graph(graph, num_of_entities, rng=None, replace=True, weighted=False):
+    random_entities = pick_random_entity_ids(graph, num_of_entities, rng, replace, weighted)
+    if not isinstance(graph, RDF_Star_Graph):
+        return random_entities
+    terms = graph.terms.terms
+    return [str(terms[ent]) for ent in random_entities]
+
+# Generate nested subgraphs for several entity counts from one draw of
+# entities without replacement. Each subgraph uses the first entity_count
+# entities of the draw, capped at stmt_limit triples per entity if given
+def sample_subsets(graph, entity_counts, stmt_limit=None, rng=None, weighted=False):
+    entities = pick_random_entities_graph(graph, max(entity_counts), rng, replace=False, weighted=weighted)
+    
+    subsets = []
+    for count in entity_counts:
+        if stmt_limit is None:
+            subsets.append(generate_subset(graph, entities[:count]))
+        else:
+            subsets.append(generate_subset_limited(graph, entities[:count], stmt_limit))
+    return subsets
 
 # Generate a subgraph from the list of entities
 def generate_subset(graph, entities_list):
-    new_graph = RDF_Star_Graph()
+    if isinstance(graph, RDF_Star_Graph):
+        # Only visit the statements of the given entities
+        return graph.subgraph(graph.entityStatements(graph.entityIds(entities_list)))
     
+    new_graph = RDF_Star_Graph()
     for triple in graph:
         if _triple_check(triple, entities_list):
             new_graph.add(triple)
@@ -616,8 +3391,37 @@ def generate_subset(graph, entities_list):
     return new_graph
 
 # Generate a subgraph from the list of entities, but put a cap on the number of 
-# triples per entity
+# triples per entity. As in generate_subset, a graph only visits the
+# statements of the given entities
 def generate_subset_limited(graph, entities_list, limit):
+    if not isinstance(graph, RDF_Star_Graph):
+        return _generate_subset_limited_scan(graph, entities_list, limit)
+    
+    entity_ids = graph.entityIds(entities_list)
+    entities_count = dict()
+    positions = []
+    terms = graph.terms
+    
+    for position in graph.entityStatements(entity_ids):
+        subj_id = graph.subj_ids[position]
+        obj_id = graph.obj_ids[position]
+        
+        for ent in terms.statementEntities(subj_id, obj_id):
+            if (ent in entity_ids) and (entities_count.setdefault(ent, 0) < limit):
+                
+                # Add to graph only if not all limits are reached
+                # Entity needs to be in the list
+                positions.append(position)
+                
+                # Add to limit count of that particular entity
+                # Allow space in other entities
+                entities_count[ent] += 1
+                break
+    
+    return graph.subgraph(positions)
+
+# Same as generate_subset_limited, but by scanning any iterable of triples
+def _generate_subset_limited_scan(graph, entities_list, limit):
     entities_count = dict()
     new_graph = RDF_Star_Graph()
     
@@ -635,127 +3439,112 @@ def generate_subset_limited(graph, entities_list, limit):
                     
                     # Add to limit count of that particular entity
                     # Allow space in other entities
-                    if ent in entities_count:
-                        entities_count[ent] += 1
-                    else:
-                        entities_count[ent] = 1
-                        
+                    entities_count[ent] += 1
                     break
     
     return new_graph
 
 # Do sampling process twice with cap of number of triples per entity
-def double_sampling(graph, first_entity_count, first_stmt_limit, second_entity_count, second_stmt_limit):
-    print("Picking initial set of entities ...")
-    init_entities = pick_random_entities_graph(graph, first_entity_count)
-    print("Generating first subset ...")
-    first_subset = generate_subset_limited(graph, init_entities, first_stmt_limit)
+# rng can be a seed or a random.Random instance, for reproducible runs
+def double_sampling(graph, first_entity_count, first_stmt_limit, second_entity_count, second_stmt_limit, 
+                    rng=None, replace=True, weighted=False):
+    rng = _make_rng(rng)
+    _log("Picking initial set of entities ...")
+    with _phase("sampling.pick_entities"):
+        init_entities = pick_random_entities_graph(graph, first_entity_count, rng, replace, weighted)
+    _log("Generating first subset ...")
+    with _phase("sampling.generate_subset"):
+        first_subset = generate_subset_limited(graph, init_entities, first_stmt_limit)
     
-    print("Picking entities within the subset ...")
-    snd_entities = pick_random_entities_graph(first_subset, second_entity_count)
-    print("Generating new subset ...")
-    sec_subset = generate_subset_limited(graph, snd_entities, second_stmt_limit)
+    _log("Picking entities within the subset ...")
+    with _phase("sampling.pick_entities"):
+        snd_entities = pick_random_entities_graph(first_subset, second_entity_count, rng, replace, weighted)
+    _log("Generating new subset ...")
+    with _phase("sampling.generate_subset"):
+        sec_subset = generate_subset_limited(graph, snd_entities, second_stmt_limit)
     
     return sec_subset
 
 # Do sampling process twice, but without the cap on number of triples per entity
-def double_sampling_full(graph, first_entity_count, second_entity_count):
-    print("Picking initial set of entities ...")
-    init_entities = pick_random_entities_graph(graph, first_entity_count)
-    print("Generating first subset ...")
-    first_subset = generate_subset(graph, init_entities)
+def double_sampling_full(graph, first_entity_count, second_entity_count, rng=None, replace=True, weighted=False):
+    rng = _make_rng(rng)
+    _log("Picking initial set of entities ...")
+    with _phase("sampling.pick_entities"):
+        init_entities = pick_random_entities_graph(graph, first_entity_count, rng, replace, weighted)
+    _log("Generating first subset ...")
+    with _phase("sampling.generate_subset"):
+        first_subset = generate_subset(graph, init_entities)
     
-    print("Picking entities within the subset ...")
-    snd_entities = pick_random_entities_graph(first_subset, second_entity_count)
-    print("Generating new subset ...")
-    sec_subset = generate_subset(graph, union(init_entities, snd_entities))
+    _log("Picking entities within the subset ...")
+    with _phase("sampling.pick_entities"):
+        snd_entities = pick_random_entities_graph(first_subset, second_entity_count, rng, replace, weighted)
+    _log("Generating new subset ...")
+    with _phase("sampling.generate_subset"):
+        sec_subset = generate_subset(graph, union(init_entities, snd_entities))
     
     return sec_subset
 
-# Check if the triple contains entities that are in the list of entities
+# Check if the triple contains entities (at any depth) that are in the list
+# of entities
 def _triple_check(triple, entities_list):
-    # Case 1: Single-level RDF* triple
-    if triple.isRDFTriple():
-        return (triple.subj in entities_list) or (triple.obj in entities_list)
-    
-    # Case 2: Subject is RDF* triple, object is not RDF* triple
-    elif isinstance(triple.subj, RDF_Star_Triple) and not isinstance(triple.obj, RDF_Star_Triple):
-        return _triple_check(triple.subj, entities_list) or (triple.obj in entities_list)
-    
-    # Case 3: Object is RDF*, subject is not RDF*
-    elif not isinstance(triple.subj, RDF_Star_Triple) and isinstance(triple.obj, RDF_Star_Triple):
-        return (triple.subj in entities_list) or _triple_check(triple.obj, entities_list)
+    for term in _entity_terms(triple):
+        if term in entities_list:
+            return True
+    return False
+
+# Get the entities of a triple, at any depth, in order of appearance
+def _entity_terms(triple):
+    if triple._level > 1:
+        return _leaves(_statement_terms(triple), _statement_children)
     
-    # Case 4: Both subject and object are RDF* triples
-    elif isinstance(triple.subj, RDF_Star_Triple) and isinstance(triple.obj, RDF_Star_Triple):
-        return _triple_check(triple.subj, entities_list) or _triple_check(triple.obj, entities_list)
+    entities = []
+    for term in _statement_terms(triple):
+        if isinstance(term, RDF_Star_Triple):
+            entities.append(term.subj)
+            entities.append(term.obj)
+        else:
+            entities.append(term)
+    return entities
 
 # Count the number of entities in a graph
 def entity_count(graph):    
+    if isinstance(graph, RDF_Star_Graph):
+        return len(graph.entity_index)
     return len(graph_entities(graph))
 
+# Other iterables of triples, such as lists or translation views, are scanned
 def graph_entities(graph):
-    entities = []
-    
-    for triple in graph:
-        for ent in triple_entities(triple):
-            if not (ent in entities):
-                entities.append(ent)
-    
-    return entities
+    if isinstance(graph, RDF_Star_Graph):
+        return graph.entities()
+    return list(dict.fromkeys(chain.from_iterable(map(triple_entities, graph))))
 
-# Helper function to get list of entities in a triple
+# Helper function to get list of entities in a triple, at any depth,
+# without duplicates and in order of appearance
 def triple_entities(triple):
-    entities = []
-    if not isinstance(triple.subj, RDF_Star_Triple):
-        # So the subject is not an RDF* triple
-        if not (str(triple.subj) in entities):
-            entities.append(str(triple.subj))
-    else:
-        for ent in triple_entities(triple.subj):
-            if not (ent in entities):
-                entities.append(ent)
-    
-    if not isinstance(triple.obj, RDF_Star_Triple):
-        # So the object is not an RDF* triple
-        if not (str(triple.obj) in entities):
-            entities.append(str(triple.obj))
-    else:
-        for ent in triple_entities(triple.obj):
-            if not (ent in entities):
-                entities.append(ent)
-    
-    return entities
+    return list(dict.fromkeys(map(str, _entity_terms(triple))))
 
 # Define relationship count
 def relation_count(graph):
+    if isinstance(graph, RDF_Star_Graph):
+        return len(graph.relation_index)
     return len(graph_relations(graph))
     
 def graph_relations(graph):
-    relations = []
-    
-    for triple in graph:
-        for rel in triple_relations(triple):
-            if not (rel in relations):
-                relations.append(rel)
-    
-    return relations
+    if isinstance(graph, RDF_Star_Graph):
+        return graph.relations()
+    return list(dict.fromkeys(chain.from_iterable(map(triple_relations, graph))))
     
-# Helper function to get list of relations in a triple
+# Helper function to get list of relations in a triple, at any depth,
+# without duplicates and in order of appearance
 def triple_relations(triple):
-    relations = [str(triple.pred)]
-    
-    if isinstance(triple.subj, RDF_Star_Triple):
-        for rel in triple_relations(triple.subj):
-            if not (rel in relations):
-                relations.append(rel)
-    
-    if isinstance(triple.obj, RDF_Star_Triple):
-        for rel in triple_relations(triple.obj):
-            if not (rel in relations):
-                relations.append(rel)
-    
-    return relations
+    relations = {str(triple.pred): None}   # Used as an ordered set
+    if triple._level > 1:
+        quoted_triples = _visit(_quoted_triples(triple), _quoted_triples)
+    else:
+        quoted_triples = _quoted_triples(triple)
+    for quoted in quoted_triples:
+        relations[str(quoted.pred)] = None
+    return list(relations)
 
 def union(list1, list2):
     return list(set(list1) | set(list2))
@@ -772,4 +3561,4 @@ def unique_triples_count(graph):
 
 # Helper function
 def graph_triples(graph):
-    return set(list(map(str, graph)))
\ No newline at end of file
+    return set(map(str, graph))
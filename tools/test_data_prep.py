@@ -0,0 +1,72 @@
+import hashlib
+from bisect import bisect_right
+
+import pytest
+
+import data_prep
+from data_prep import shuffle_data, train_test_split, train_valid_test_split
+
+_texts = ["".join("<e%d>\t<p>\t<e%d>\n" % (i, i * 7 % 13) for i in range(50)),
+          "".join("<e%d>\t<p>\t\"ü%d\"\r\n" % (i, i) for i in range(37)),
+          "a\r\nb\n\nc\rd\r\n\r\ne\r\nlast without newline",
+          "only line",
+          ""]
+
+# Lines as the original text mode splitter read them
+def _lines(path):
+    with open(path, encoding='utf-8') as in_file:
+        return in_file.readlines()
+
+# The original in-memory splitter: the first lines go to the first split
+# and so on, with each size rounded down as the original did
+def _split_in_memory(lines, fractions):
+    splits = []
+    start = 0
+    for p in fractions:
+        size = int(len(lines) * p)
+        splits.append(lines[start:start + size])
+        start += size
+    splits.append(lines[start:])
+    return ["".join(split).encode('utf-8') for split in splits]
+
+def _split_by_hash_in_memory(lines, fractions):
+    limits = []
+    total = 0
+    for p in fractions:
+        total += p
+        limits.append(int(total * 2**64))
+    splits = [[] for _ in range(len(fractions) + 1)]
+    for line in lines:
+        digest = hashlib.blake2b(line.rstrip("\n").encode('utf-8'), digest_size=8).digest()
+        splits[bisect_right(limits, int.from_bytes(digest, "big"))].append(line)
+    return ["".join(split).encode('utf-8') for split in splits]
+
+@pytest.mark.parametrize("block_size", [1, 2, 3, 7, 64, 1 << 24])
+@pytest.mark.parametrize("text", _texts)
+def test_splits_match_in_memory_splitter(tmp_path, monkeypatch, block_size, text):
+    monkeypatch.setattr(data_prep, "block_size", block_size)
+    in_path = tmp_path / "in.tsv"
+    in_path.write_bytes(text.encode('utf-8'))
+    lines = _lines(in_path)
+    names = [str(tmp_path / name) for name in ("train.tsv", "valid.tsv", "test.tsv")]
+
+    for by_hash, reference in ((False, _split_in_memory), (True, _split_by_hash_in_memory)):
+        train_valid_test_split(str(in_path), *names, train_p=0.7, valid_p=0.2, by_hash=by_hash)
+        assert [open(name, "rb").read() for name in names] == reference(lines, [0.7, 0.2])
+        train_test_split(str(in_path), *names[::2], train_p=0.6, by_hash=by_hash)
+        assert [open(name, "rb").read() for name in names[::2]] == reference(lines, [0.6])
+
+@pytest.mark.parametrize("memory_limit", [16, 100, 1 << 30])
+@pytest.mark.parametrize("text", _texts)
+def test_shuffle_keeps_every_line(tmp_path, monkeypatch, memory_limit, text):
+    monkeypatch.setattr(data_prep, "block_size", 5)
+    in_path = tmp_path / "in.tsv"
+    in_path.write_bytes(text.encode('utf-8'))
+    out_path = tmp_path / "out.tsv"
+    shuffle_data(str(in_path), str(out_path), seed=3, memory_limit=memory_limit)
+    expected = sorted(line if line.endswith("\n") else line + "\n" for line in _lines(in_path))
+    assert sorted(_lines(out_path)) == expected
+
+    first = out_path.read_bytes()
+    shuffle_data(str(in_path), str(out_path), seed=3, memory_limit=memory_limit)
+    assert out_path.read_bytes() == first
@@ -0,0 +1,280 @@
+import pickle
+
+import pytest
+
+from rdf_star import (Blank_Node, Hyper_Statement, Incremental_Translation, RDF_Star_Graph, RDF_Star_Triple,
+                      Translation_View, dedup_triples, entity_count, graph_entities, graph_relations, load_binary,
+                      pick_random_entities_graph, read_turtle, relation_count, stream_translation, translate_hyper,
+                      translation_algos)
+
+def _round_trip(tmp_path, graph, name="graph.bin"):
+    path = str(tmp_path / name)
+    graph.save_binary(path)
+    return load_binary(path)
+
+def test_binary_round_trip_nested(tmp_path):
+    graph = RDF_Star_Graph()
+    graph.addAll([RDF_Star_Triple((("<a>", "<p>", "<b>"), "<q>", "<c>"), "<r>", ("<d>", "<p>", "<e>")),
+                  RDF_Star_Triple("<a>", "<p>", "<b>"),
+                  RDF_Star_Triple(("<a>", "<p>", "<b>"), "<s>", '"x"')])
+    loaded = _round_trip(tmp_path, graph)
+    assert list(loaded) == list(graph)
+    assert [str(triple) for triple in loaded] == [str(triple) for triple in graph]
+
+def test_binary_round_trip_literals(tmp_path):
+    graph = RDF_Star_Graph()
+    graph.add(("<a>", "<p>", '"tab\there"'))
+    graph.add((("<a>", "<p>", '"line\nbreak\r\n"'), "<q>", '"ünïcode"@en'))
+    assert list(_round_trip(tmp_path, graph)) == list(graph)
+
+def test_binary_round_trip_empty(tmp_path):
+    loaded = _round_trip(tmp_path, RDF_Star_Graph())
+    assert len(loaded) == 0
+    assert list(loaded) == []
+
+def test_binary_add_after_load(tmp_path):
+    graph = RDF_Star_Graph()
+    graph.add((("<a>", "<p>", "<b>"), "<q>", "<c>"))
+    loaded = _round_trip(tmp_path, graph)
+    loaded.add((("<a>", "<p>", "<b>"), "<r>", "<d>"))
+    loaded.add(("<e>", "<p>", "<c>"))
+    graph.add((("<a>", "<p>", "<b>"), "<r>", "<d>"))
+    graph.add(("<e>", "<p>", "<c>"))
+    assert list(loaded) == list(graph)
+    assert loaded.entities() == graph.entities()
+    assert list(_round_trip(tmp_path, loaded, "again.bin")) == list(graph)
+
+def _read(tmp_path, text):
+    path = tmp_path / "data.ttl"
+    path.write_text(text)
+    return list(read_turtle(str(path)))
+
+def test_trailing_comment(tmp_path):
+    assert _read(tmp_path, '<a> <p> <b> .\n# trailing\n') == [("<a>", "<p>", "<b>")]
+
+def test_commented_out_last_triple(tmp_path):
+    text = '<a> <p> <b> .\n# <a> <p> <c> .'
+    assert _read(tmp_path, text) == [("<a>", "<p>", "<b>")]
+
+def test_comments_between_terms(tmp_path):
+    text = '# header\n<a> # subject\n <p> <b> . # end\n<c> <p> "d" .#last'
+    assert _read(tmp_path, text) == [("<a>", "<p>", "<b>"), ("<c>", "<p>", '"d"')]
+
+def test_invalid_syntax(tmp_path):
+    with pytest.raises(ValueError):
+        _read(tmp_path, '<a> <p> <b> .\n` # broken\n')
+
+def test_comment_heavy_document(tmp_path):
+    text = ("# @prefix ex: <http://example.org/> .\n"
+            "@prefix ex: <http://example.org/> . # ex: \"not\" a <term>\n"
+            "#\n\t# << ex:a ex:p ex:b >> ex:q ex:c .\n"
+            "<< ex:a ex:p ex:b >> # quoted\n  ex:q   # predicate\n ex:c . #\n") * 50
+    text += "# <a> <p> <c> .\r\n# last line without newline"
+    triple = (("<http://example.org/a>", "<http://example.org/p>", "<http://example.org/b>"),
+              "<http://example.org/q>", "<http://example.org/c>")
+    assert _read(tmp_path, text) == [triple] * 50
+
+def test_external_dedup_keeps_blank_nodes():
+    blank = Blank_Node()
+    triples = [RDF_Star_Triple(blank, "<p>", '"%d"' % (i % 5)) for i in range(20)]
+    triples.append(RDF_Star_Triple("<a>", "<p>", ("<b>", "<q>", blank)))
+    result = list(dedup_triples(triples, max_fingerprints=2, run_size=3))
+    assert result == list(dedup_triples(triples))
+    assert all(triple.subj is blank for triple in result[:-1])
+    assert result[-1].obj.obj is blank
+
+def test_translate_hyper_nested_main_without_qualifiers():
+    statement = Hyper_Statement((("<a>", "<p>", "<b>"), "<q>", "<c>"), [])
+    result = translate_hyper(statement, "unqualiification")
+    assert result == list(translation_algos["unqualiification"](statement.main, "n-triples"))
+    assert all(triple._level == 0 for triple in result)
+
+def test_counts_of_lists_and_views():
+    triples = [RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<c>"), RDF_Star_Triple("<c>", "<p>", "<d>")]
+    graph = RDF_Star_Graph()
+    graph.addAll(triples)
+    assert graph_entities(triples) == graph_entities(graph) == ["<a>", "<b>", "<c>", "<d>"]
+    assert graph_relations(triples) == graph_relations(graph) == ["<q>", "<p>"]
+    view = Translation_View(triples, "unqualiification")
+    assert entity_count(view) == 4
+    assert relation_count(view) == 1
+
+def test_parallel_translation_gives_blank_nodes():
+    graph = RDF_Star_Graph()
+    graph.addAll([RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<c>"),
+                  RDF_Star_Triple(("<a>", "<p>", "<b>"), "<r>", "<d>")])
+    serial = graph.performTranslationAlgo("std_reification")
+    parallel = graph.performTranslationAlgo("std_reification", processes=2, chunk_size=1)
+    assert len(parallel) == len(serial)
+    assert len(set(parallel.terms.terms)) == len(set(serial.terms.terms))
+    blank_nodes = {triple.subj for triple in parallel}
+    assert len(blank_nodes) == 1
+    assert all(isinstance(blank, Blank_Node) for blank in blank_nodes)
+
+def test_triples_cannot_be_changed_in_place():
+    triple = RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<c>")
+    with pytest.raises(AttributeError):
+        triple.setSubject("<d>")
+    with pytest.raises(AttributeError):
+        triple.replaceAll("<a>", "<d>")
+    assert triple.withObject("<d>") == RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<d>")
+    assert triple.withReplaced("<a>", "<d>").subj == RDF_Star_Triple("<d>", "<p>", "<b>")
+    graph = RDF_Star_Graph()
+    graph.add(triple)
+    with pytest.raises(AttributeError):
+        graph.triples_list.append(triple)
+
+def test_loaded_blank_nodes_keep_apart(tmp_path):
+    graph = RDF_Star_Graph()
+    graph.addAll([RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<c>"),
+                  RDF_Star_Triple(("<d>", "<p>", "<b>"), "<q>", "<c>")])
+    translated = graph.performTranslationAlgos(["std_reification"])["std_reification"]
+    again = graph.performTranslationAlgos(["std_reification"])["std_reification"]
+    assert [str(triple) for triple in again] == [str(triple) for triple in translated]
+    
+    loaded = _round_trip(tmp_path, translated)
+    other = _round_trip(tmp_path, translated, "other.bin")
+    loaded.addAll(list(again))
+    loaded.addAll(list(other))
+    blank_nodes = {triple.subj for triple in loaded if isinstance(triple.subj, Blank_Node)}
+    assert len(blank_nodes) == 6
+    assert len(set(map(str, blank_nodes))) == 6
+    assert len({triple.subj for triple in _round_trip(tmp_path, loaded, "all.bin")}) == 6
+
+def test_translation_runs_start_fresh(tmp_path):
+    in_file = tmp_path / "in.tsv"
+    in_file.write_text("<<\t<a>\t<p>\t<b>\t>>\t<q>\t<c>\t.\n<<\t<a>\t<p>\t<b>\t>>\t<r>\t<d>\t.\n")
+    graph = RDF_Star_Graph()
+    graph.parse(str(in_file))
+    first = [str(triple) for triple in graph.performTranslationAlgo("std_reification")]
+    assert [str(triple) for triple in graph.performTranslationAlgo("std_reification")] == first
+    
+    graph.performTranslationAlgo("std_reification").serialise(str(tmp_path / "memory.tsv"))
+    for name in ("stream1.tsv", "stream2.tsv"):
+        stream_translation(str(in_file), str(tmp_path / name), "std_reification")
+        assert (tmp_path / name).read_bytes() == (tmp_path / "memory.tsv").read_bytes()
+
+def test_reification_tags_only_when_emitted():
+    graph = RDF_Star_Graph()
+    graph.add((("<a>", "<p>", "<b>"), "<q>", "<c>"))
+    tags = {"<https://w3c.github.io/rdf-star/unstar#%s>" % part for part in ("subject", "predicate", "object")}
+    assert not tags & set(graph.simplify().terms.terms)
+    assert not tags & set(graph.performTranslationAlgo("unqualiification").terms.terms)
+    assert tags <= set(graph.performTranslationAlgo("std_reification").terms.terms)
+
+def test_pick_random_entities_of_lists_and_views():
+    triples = [RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<c>"), RDF_Star_Triple("<c>", "<p>", "<d>"),
+               RDF_Star_Triple("<c>", "<r>", ("<a>", "<p>", "<e>"))]
+    graph = RDF_Star_Graph()
+    graph.addAll(triples)
+    for replace in (True, False):
+        for weighted in (False, True):
+            picked = pick_random_entities_graph(graph, 3, 7, replace, weighted)
+            assert pick_random_entities_graph(triples, 3, 7, replace, weighted) == picked
+    view = Translation_View(triples, "unqualiification")
+    assert set(pick_random_entities_graph(view, 5, 7, replace=False, weighted=True)) == set(graph_entities(view))
+
+def test_pickle_deeply_nested_triple():
+    triple = RDF_Star_Triple("<a>", "<p>", "<b>")
+    for level in range(3000):
+        triple = RDF_Star_Triple(triple, "<q%d>" % level, Blank_Node(str(level)) if level % 2 else '"x"')
+    copy = pickle.loads(pickle.dumps(triple))
+    assert copy == triple
+    assert copy._level == 3000
+
+def test_binary_save_over_loaded_file(tmp_path):
+    graph = RDF_Star_Graph()
+    graph.add((("<a>", "<p>", "<b>"), "<q>", "<c>"))
+    loaded = _round_trip(tmp_path, graph)
+    loaded.add(("<e>", "<p>", "<c>"))
+    graph.add(("<e>", "<p>", "<c>"))
+    assert list(_round_trip(tmp_path, loaded)) == list(graph)
+    assert list(loaded) == list(graph)
+
+def _matches(term, pattern):
+    if pattern is None:
+        return True
+    if isinstance(pattern, tuple):
+        return isinstance(term, RDF_Star_Triple) and all(map(_matches, (term.subj, term.pred, term.obj), pattern))
+    return term == pattern
+
+def test_match_against_scan():
+    graph = RDF_Star_Graph()
+    graph.addAll([RDF_Star_Triple("<a>", "<p>", "<b>"), RDF_Star_Triple(("<a>", "<p>", "<b>"), "<q>", "<c>"),
+                  RDF_Star_Triple("<c>", "<q>", ("<a>", "<p>", "<b>")), RDF_Star_Triple("<c>", "<p>", "<a>"),
+                  RDF_Star_Triple((("<a>", "<p>", "<b>"), "<q>", "<c>"), "<r>", ("<b>", "<p>", "<c>")),
+                  RDF_Star_Triple(("<b>", "<p>", "<c>"), "<q>", '"d"')])
+    quoted = [("<a>", "<p>", "<b>"), ("<b>", "<p>", "<c>"), (("<a>", "<p>", "<b>"), "<q>", "<c>")]
+    nested = [("<a>", None, None), (None, "<p>", None), ((None, None, "<b>"), None, "<c>"), (None, None, None)]
+    entities = [None, "<a>", "<b>", "<c>", '"d"', "<x>"] + quoted + nested
+    relations = [None, "<p>", "<q>", "<r>", "<x>"]
+    
+    def check():
+        for subj in entities:
+            for pred in relations:
+                for obj in entities:
+                    expected = [triple for triple in graph
+                                if _matches(triple.subj, subj) and _matches(triple.pred, pred)
+                                and _matches(triple.obj, obj)]
+                    assert graph.match(subj, pred, obj) == expected, (subj, pred, obj)
+    check()
+    graph.add(("<a>", "<q>", (("<a>", "<p>", "<b>"), "<q>", "<c>")))
+    graph.add((("<b>", "<r>", "<a>"), "<p>", "<b>"))
+    check()
+
+def test_incremental_translation_against_full():
+    batches = [([("<a>", "<p>", "<b>"), (("<a>", "<p>", "<b>"), "<q>", "<c>"), ("<c>", "<q>", ("<a>", "<p>", "<b>")),
+                 ((("<a>", "<p>", "<b>"), "<q>", "<c>"), "<r>", ("<b>", "<p>", "<c>")), ("<c>", "<p>", "<a>")], []),
+               ([(("<b>", "<p>", "<c>"), "<q>", '"d"'), ("<c>", "<p>", "<a>")], [("<a>", "<p>", "<b>")]),
+               ([], [(("<a>", "<p>", "<b>"), "<q>", "<c>"), ("<x>", "<p>", "<y>"), ("<c>", "<p>", "<a>")]),
+               ([("<e>", "<r>", ("<b>", "<p>", "<c>"))], [("<c>", "<q>", ("<a>", "<p>", "<b>"))])]
+    for algo in translation_algos:
+        incremental = Incremental_Translation(algo)
+        source = []
+        for added, removed in batches:
+            incremental.apply(added, removed)
+            for triple in removed:
+                if triple in source:
+                    source.remove(triple)
+            source.extend(added)
+            graph = RDF_Star_Graph()
+            graph.addAll(RDF_Star_Triple(*triple) for triple in source)
+            full = graph.performTranslationAlgo(algo, processes=2, chunk_size=2, dedup=True)
+            assert sorted(map(str, incremental.toGraph())) == sorted(map(str, full)), algo
+
+# The replaceAll of the original RDF_Star_Triple, on nested tuples, with
+# predicates replaced too if relations is set
+def _replace_all(triple, mapping, relations):
+    replaced = []
+    for index, term in enumerate(triple):
+        if index == 1 and not relations:
+            replaced.append(term)
+        elif term in mapping:
+            replaced.append(mapping[term])
+        elif isinstance(term, tuple):
+            replaced.append(_replace_all(term, mapping, relations))
+        else:
+            replaced.append(term)
+    return tuple(replaced)
+
+def test_remap_against_replace_all():
+    source = [("<a>", "<p>", "<b>"), (("<a>", "<p>", "<b>"), "<q>", "<c>"), ("<c>", "<a>", ("<b>", "<p>", "<a>")),
+              ((("<a>", "<p>", "<b>"), "<q>", "<c>"), "<r>", ("<b>", "<p>", "<c>")), ("<d>", "<p>", '"a"')]
+    mappings = [{"<a>": "<x>"}, {"<a>": "<b>", "<b>": "<a>"}, {"<p>": "<s>", "<c>": "<a>"},
+                {("<a>", "<p>", "<b>"): "<x>"}, {(("<a>", "<p>", "<b>"), "<q>", "<c>"): "<x>", "<c>": "<y>"},
+                {"<z>": "<x>"}]
+    for mapping in mappings:
+        for relations in (True, False):
+            graph = RDF_Star_Graph()
+            graph.addAll(RDF_Star_Triple(*triple) for triple in source)
+            graph.remap({RDF_Star_Triple(*old) if isinstance(old, tuple) else old: new
+                         for old, new in mapping.items()}, relations)
+            expected = [RDF_Star_Triple(*_replace_all(triple, mapping, relations)) for triple in source]
+            assert list(graph) == expected, (mapping, relations)
+            
+            if len(mapping) == 1:
+                graph = RDF_Star_Graph()
+                graph.addAll(RDF_Star_Triple(*triple) for triple in source)
+                (old, new), = mapping.items()
+                graph.replaceAll(RDF_Star_Triple(*old) if isinstance(old, tuple) else old, new)
+                assert list(graph) == [RDF_Star_Triple(*_replace_all(triple, mapping, False)) for triple in source]